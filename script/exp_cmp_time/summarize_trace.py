@@ -0,0 +1,35 @@
+''' Summarize the per-phase traces written with `--profile`.
+
+    python summarize_trace.py <dir containing trace_*.jsonl>
+'''
+import os
+import sys
+import json
+from collections import defaultdict
+
+dir_name = os.path.abspath(sys.argv[1])
+for root, _, files in os.walk(dir_name):
+    for _file in sorted(files):
+        if not (_file.startswith('trace_') and _file.endswith('.jsonl')):
+            continue
+        durations = defaultdict(float)
+        num_samples = defaultdict(int)
+        rss = defaultdict(int)  # largest resident memory at the end of a phase
+        rounds = set()
+        with open(os.path.join(root, _file), 'r') as fp:
+            for line in fp:
+                record = json.loads(line)
+                rounds.add(record['round'])
+                durations[record['phase']] += record['duration']
+                num_samples[record['phase']] += record.get('num_samples', 0)
+                rss[record['phase']] = max(rss[record['phase']], record.get('rss', 0))
+
+        num_rounds = max(len(rounds), 1)
+        print(f"{os.path.relpath(os.path.join(root, _file), dir_name)}: {len(rounds)} rounds")
+        for phase in sorted(durations, key=lambda p: -durations[p]):
+            line = f"  {phase:<16} {durations[phase] / num_rounds:.4f}s per round"
+            if num_samples[phase] > 0 and durations[phase] > 0:
+                line += f", {num_samples[phase] / durations[phase]:.1f} samples/s"
+            if rss[phase] > 0:
+                line += f", rss up to {rss[phase] / 2 ** 20:.0f} MB"
+            print(line)
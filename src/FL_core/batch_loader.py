@@ -0,0 +1,65 @@
+'''
+In-memory batch iteration over client datasets.
+
+Client datasets are mostly `TensorDataset`s whose samples already sit in
+contiguous tensors. Batches are sliced from the backing tensors by index,
+without the per-sample `__getitem__` and collate work of a `DataLoader`
+and without creating one per client call. Other datasets fall back to a
+`DataLoader` with the same batches.
+'''
+import torch
+from torch.utils.data import DataLoader
+
+
+class TensorBatchLoader:
+    def __init__(self, tensors, batch_size, order=None, pin_memory=False):
+        """
+        Args
+            tensors: backing tensors of a TensorDataset
+            batch_size: batch size
+            order: sample order (default: sequential)
+            pin_memory: pin every batch, for asynchronous copies to the GPU
+        """
+        self.tensors = tensors
+        self.batch_size = batch_size
+        self.order = None if order is None else torch.as_tensor(order, dtype=torch.long)
+        self.pin_memory = pin_memory
+        self.num_samples = len(tensors[0])
+
+    def __len__(self):
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        for start in range(0, self.num_samples, self.batch_size):
+            if self.order is None:
+                batch = [t[start: start + self.batch_size] for t in self.tensors]
+            else:
+                idxs = self.order[start: start + self.batch_size]
+                batch = [t[idxs] for t in self.tensors]
+            if self.pin_memory:
+                batch = [t.pin_memory() for t in batch]
+            yield batch
+
+
+def global_shuffle_order(num_samples):
+    """
+    sample order of one epoch drawn from the global torch RNG as a
+    `DataLoader(shuffle=True)` iterator draws it: the base seed of the
+    iterator, then the seed of its `RandomSampler`
+    """
+    torch.empty((), dtype=torch.int64).random_()
+    seed = int(torch.empty((), dtype=torch.int64).random_().item())
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return torch.randperm(num_samples, generator=generator).tolist()
+
+
+def batch_loader(data, batch_size, order=None, device='cpu'):
+    """
+    batches of `data` in the given sample order (default: sequential);
+    batches are pinned only when they go to a GPU
+    """
+    pin_memory = torch.device(device).type == 'cuda'
+    if hasattr(data, 'tensors'):
+        return TensorBatchLoader(data.tensors, batch_size, order=order, pin_memory=pin_memory)
+    return DataLoader(data, batch_size=batch_size, sampler=order, pin_memory=pin_memory)
@@ -0,0 +1,84 @@
+'''
+Checkpoints of the complete server state for long runs.
+
+A checkpoint holds the global model, the state of the aggregation and
+client selection methods, the decayed local learning rate, the clients'
+training counters and every RNG stream (Python, NumPy, Torch, CUDA), so a
+resumed run continues exactly where the checkpointed one stopped.
+
+The state is snapshotted synchronously at the end of a round and written
+to disk by a background thread (`torch.save` to a temporary file, then an
+atomic `os.replace`), so rounds are not stalled by disk I/O and a crash
+never leaves a truncated checkpoint behind.
+'''
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import numpy as np
+import torch
+
+from utils import logger
+
+
+def get_rng_state():
+    """
+    states of all the RNG streams used during training
+    """
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def save_atomic(obj, path):
+    """
+    write `obj` to `path` with `torch.save`, replacing any previous file atomically
+    """
+    torch.save(obj, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+class CheckpointWriter:
+    def __init__(self, path):
+        """
+        asynchronous writer of checkpoints to one file
+        ---
+        Args
+            path: checkpoint file, overwritten by every checkpoint
+        """
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def write(self, state):
+        """
+        write a checkpoint in the background; `state` must not be modified
+        afterwards (snapshot it first). Waits for the previous write.
+        """
+        self.wait()
+        self.pending = self.executor.submit(save_atomic, state, self.path)
+
+    def wait(self):
+        if self.pending is None:
+            return
+        future, self.pending = self.pending, None
+        try:
+            future.result()
+        except OSError as e:
+            logger.warn(f"Fail to write checkpoint {self.path}: {e}")
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
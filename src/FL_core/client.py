@@ -6,7 +6,7 @@ from copy import deepcopy
 
 
 class Client(object):
-    def __init__(self, client_idx, nTrain, local_train_data, local_test_data, args):
+    def __init__(self, client_idx, nTrain, local_train_data, local_test_data, args, model_pool=None):
         """
         A client
         ---
@@ -17,15 +17,19 @@ class Client(object):
             local_test_data: test dataset of the client
             model: given model for the client
             args: arguments for overall FL training
+            model_pool: optional ModelPool shared by the clients' trainers
         """
         self.client_idx = client_idx
         self.test_data = local_test_data
         self.device = args.device
-        self.trainer = Trainer(args)
+        self.trainer = Trainer(args, model_pool=model_pool)
         self.num_epoch = args.num_epoch  # E: number of local epoch
         self.nTrain = nTrain
         self.loss_div_sqrt = args.loss_div_sqrt
         self.loss_sum = args.loss_sum
+        self.seed = args.seed
+        self.seeded_shuffle = args.seeded_shuffle
+        self.num_trainings = 0
 
         self.labeled_indices = [*range(nTrain)]
         self.labeled_data = local_train_data  # train_data
@@ -47,9 +51,28 @@ class Client(object):
         if self.num_epoch == 0:  # no SGD updates
             result = self.trainer.train_E0(self.labeled_data)
         else:
-            result = self.trainer.train(self.labeled_data, mu=mu, global_model=global_model)
+            shuffle_seed = self.next_shuffle_seed() if self.seeded_shuffle else None
+            result = self.trainer.train(self.labeled_data, mu=mu, global_model=global_model,
+                                        shuffle_seed=shuffle_seed)
         #result['model'] = self.trainer.get_model()
+        return self.scale_metric(result)
 
+    def next_shuffle_seed(self):
+        """
+        seed of the sample order of the next local training, derived from
+        (seed, client, number of local trainings so far) so that every
+        training engine visits the client's data in the same order; the
+        process pool and cohort training always use it, in-process
+        training with --seeded_shuffle only
+        """
+        seed = np.random.SeedSequence([self.seed, self.client_idx, self.num_trainings]).generate_state(1)[0]
+        self.num_trainings += 1
+        return int(seed)
+
+    def scale_metric(self, result):
+        """
+        rescale the selection metric (average local loss) of a training result
+        """
         # total loss / sqrt (# of local data)
         if self.loss_div_sqrt:  # total loss / sqrt (# of local data)
             result['metric'] *= np.sqrt(len(self.labeled_data))  # loss * n_k / np.sqrt(n_k)
@@ -70,14 +93,14 @@ class Client(object):
                                        use_local_model=use_local_model)
         return result
 
-    def elementwise_test(self, model, test_on_training_data=False):
+    def elementwise_test(self, model, test_on_training_data=False, half=False):
         # TEST
         if test_on_training_data:
             # test on training dataset
-            result = self.trainer.elementwise_test(model, self.labeled_data)
+            result = self.trainer.elementwise_test(model, self.labeled_data, half=half)
         else:
             # test on test dataset
-            result = self.trainer.elementwise_test(model, self.test_data)
+            result = self.trainer.elementwise_test(model, self.test_data, half=half)
         return result
 
     def get_client_idx(self):
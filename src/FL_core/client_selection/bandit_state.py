@@ -0,0 +1,86 @@
+'''
+Array-backed reward statistics of a multi-armed bandit over clients.
+
+Every client starts with one zero reward. Rewards are kept as running
+sums and counts in NumPy arrays, so a round costs O(selected clients)
+to update, and the mean rewards of all clients are one vectorized
+division. Optionally the statistics only cover the last `window`
+rewards of each client, or older rewards are discounted by `discount`
+per update round.
+'''
+import numpy as np
+
+
+class BanditState:
+    def __init__(self, total, window=None, discount=None):
+        """
+        reward statistics of `total` clients
+        ---
+        Args
+            total: number of clients (arms)
+            window: keep only the last `window` rewards of each client
+            discount: weight rewards by discount^(update rounds since received)
+        """
+        assert window is None or discount is None, "use either a window or a discount"
+        self.total = total
+        self.window = window
+        self.discount = discount
+
+        self.sums = np.zeros(total)
+        self.counts = np.ones(total)
+        self.selected_cnt = np.zeros(total, dtype=int)
+        self.num_updates = 0
+        if window is not None:
+            # ring buffer of the last rewards; the initial zero reward in slot 0
+            self.history = np.zeros((total, window))
+            self.head = np.ones(total, dtype=int) % window
+        if discount is not None:
+            # sums and counts of a client are discounted lazily, when it
+            # receives a reward: their ratio does not change in between
+            self.last_update = np.zeros(total, dtype=int)
+
+    def add_selections(self, client_idxs):
+        np.add.at(self.selected_cnt, client_idxs, 1)
+
+    def add_rewards(self, client_idxs, rewards):
+        """
+        record one reward for each of the given (distinct) clients
+        """
+        client_idxs = np.asarray(client_idxs, dtype=int)
+        rewards = np.asarray(rewards, dtype=float)
+        self.num_updates += 1
+        if self.window is not None:
+            full = self.counts[client_idxs] >= self.window
+            head = self.head[client_idxs]
+            self.sums[client_idxs] += rewards - np.where(full, self.history[client_idxs, head], 0.)
+            self.counts[client_idxs] += ~full
+            self.history[client_idxs, head] = rewards
+            self.head[client_idxs] = (head + 1) % self.window
+        elif self.discount is not None:
+            decay = self.discount ** (self.num_updates - self.last_update[client_idxs])
+            self.sums[client_idxs] = self.sums[client_idxs] * decay + rewards
+            self.counts[client_idxs] = self.counts[client_idxs] * decay + 1
+            self.last_update[client_idxs] = self.num_updates
+        else:
+            self.sums[client_idxs] += rewards
+            self.counts[client_idxs] += 1
+
+    def means(self):
+        """
+        mean reward of every client; -inf for all before the first update
+        """
+        if self.num_updates == 0:
+            return np.full(self.total, -np.inf)
+        return self.sums / self.counts
+
+
+def top_n(scores, n):
+    """
+    indices of the `n` largest scores, in decreasing order of score
+    (argpartition, then a sort of the `n` kept only)
+    """
+    keys = np.where(np.isnan(scores), -np.inf, -scores)  # nan ranks first, as with argsort()[::-1]
+    if n >= len(scores):
+        return np.argsort(keys, kind='stable')
+    top = np.argpartition(keys, n - 1)[:n]
+    return top[np.argsort(keys[top], kind='stable')]
@@ -1,4 +1,9 @@
+from copy import deepcopy
+import inspect
 import numpy as np
+import torch
+
+from ..flat_model import FlatLayout
 
 
 class ClientSelection:
@@ -6,10 +11,19 @@ class ClientSelection:
         self.total = total
         self.device = device
         self.server = None
+        self.param_layout = None
+        self.sketch = None
 
     def select(self, n, client_idxs, metric):
         pass
 
+    def local_model_metric(self, local_models):
+        """
+        selection metric of trained local models, in the form `select` takes
+        as `metric`; selectors returning one row per client can have it cached
+        """
+        return local_models
+
     def save_selected_clients(self, client_idxs, results):
         tmp = np.zeros(self.total)
         tmp[client_idxs] = 1
@@ -24,6 +38,81 @@ class ClientSelection:
     def post_process(self, engaged_client_indices):
         pass
 
+    # attributes rebuilt from the arguments/server rather than checkpointed
+    NON_STATE_ATTRS = ['server', 'param_layout', 'sketch', 'args', 'device']
+
+    def state_dict(self):
+        """
+        snapshot of the selection state (statistics, counters, probabilities,
+        GP models, ...) for checkpointing; functions such as schedules built
+        from the arguments are left out
+        """
+        return {k: deepcopy(v) for k, v in vars(self).items()
+                if k not in self.NON_STATE_ATTRS
+                and not (inspect.isfunction(v) or inspect.ismethod(v))}
+
+    def load_state_dict(self, state):
+        for k, v in state.items():
+            # checkpoints are loaded on cpu; keep tensors and modules where they live now
+            current = getattr(self, k, None)
+            if torch.is_tensor(v) and torch.is_tensor(current):
+                v = v.to(current.device)
+            elif isinstance(v, torch.nn.Module) and isinstance(current, torch.nn.Module):
+                params = list(current.parameters())
+                if len(params) > 0:
+                    v = v.to(params[0].device)
+            setattr(self, k, v)
+
+    def flatten_params(self, model, device=None):
+        """
+        flatten `model.parameters()` into one 1-D buffer (on `self.device` by default)
+        """
+        if self.param_layout is None:
+            self.param_layout = FlatLayout(model, params_only=True)
+        return self.param_layout.flatten(model, device=self.device if device is None else device)
+
+    def flatten_deltas(self, global_flat, local_models, device=None):
+        """
+        stack the parameter deltas `local - global` of the given local models
+        into a (models x numel) matrix
+        """
+        if self.param_layout is None:
+            self.param_layout = FlatLayout(local_models[0], params_only=True)
+        deltas = self.param_layout.flatten_many(local_models,
+            device=self.device if device is None else device)
+        deltas -= global_flat.to(deltas.device)
+        return deltas
+
+    # local models whose full deltas are materialized at once when sketching
+    SKETCH_GROUP = 16
+
+    def sketch_deltas(self, global_flat, local_models, device=None):
+        """
+        parameter deltas `local - global` of the given local models, as rows
+        of their sketches when `self.sketch` is set (a few models at a time,
+        so the full deltas of all models are never in memory together)
+        """
+        if self.sketch is None:
+            return self.flatten_deltas(global_flat, local_models, device)
+        sketches = []
+        for start in range(0, len(local_models), self.SKETCH_GROUP):
+            deltas = self.flatten_deltas(global_flat, local_models[start: start + self.SKETCH_GROUP], device)
+            sketches.append(self.sketch.sketch(deltas))
+            self.sketch.report(deltas, sketches[-1])
+        return torch.cat(sketches).to(self.device if device is None else device)
+
+    def sketch_flat(self, flat):
+        """
+        sketch of a flat parameter buffer when `self.sketch` is set
+        """
+        return flat if self.sketch is None else self.sketch.sketch(flat).to(flat.device)
+
+    def delta_segments(self):
+        """
+        (offset, numel) of each layer in the rows of `sketch_deltas`
+        """
+        return (self.param_layout if self.sketch is None else self.sketch).segments()
+
 
 
 '''Random Selection'''
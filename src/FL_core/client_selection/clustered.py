@@ -2,14 +2,13 @@
 Reference:
 https://github.com/Accenture/Labs-Federated-Learning/tree/clustered_sampling
 '''
-from itertools import product
 from scipy.cluster.hierarchy import fcluster, linkage
 from copy import deepcopy
-from tqdm import tqdm
 import torch
 import numpy as np
 
 from .client_selection import ClientSelection
+from .pairwise import pairwise_distances
 
 
 '''Clustered Sampling Algorithm 1'''
@@ -24,40 +23,81 @@ class ClusteredSampling1(ClientSelection):
         unless n_i changes during the learning process,
         Algo 1 needs to be run only once at the beginning of the learning process.
         '''
-        epsilon = int(10 ** 10)
         client_ids = sorted(n_samples.keys())
         n_samples = np.array([n_samples[i] for i in client_ids])
         weights = n_samples / np.sum(n_samples)
-        # associate each client to a cluster
-        augmented_weights = np.array([w * self.n_cluster * epsilon for w in weights])
-        ordered_client_idx = np.flip(np.argsort(augmented_weights))
-
-        distri_clusters = np.zeros((self.n_cluster, self.total)).astype(int)
-        k = 0
-        for client_idx in ordered_client_idx:
-            while augmented_weights[client_idx] > 0:
-                sum_proba_in_k = np.sum(distri_clusters[k])
-                u_i = min(epsilon - sum_proba_in_k, augmented_weights[client_idx])
-                distri_clusters[k, client_idx] = u_i
-                augmented_weights[client_idx] += -u_i
-                sum_proba_in_k = np.sum(distri_clusters[k])
-                if sum_proba_in_k == 1 * epsilon:
-                    k += 1
-
-        distri_clusters = distri_clusters.astype(float)
-        for l in range(self.n_cluster):
-            distri_clusters[l] /= np.sum(distri_clusters[l])
-
-        self.distri_clusters = distri_clusters
-
+        self.weights = weights
+        # associate each client to a cluster: clients, in decreasing order of
+        # weight, fill clusters of capacity 1 with n_cluster * weight each, so
+        # client j covers [bounds[j], bounds[j+1]) and cluster k covers [k, k+1)
+        ordered_client_idx = np.flip(np.argsort(weights))
+        bounds = np.concatenate([[0.], np.cumsum(weights[ordered_client_idx] * self.n_cluster)])
+        bounds = np.minimum(bounds, self.n_cluster)
+
+        # the clients of a cluster are contiguous in this order: keep them
+        # as (client, weight) lists in CSR form, total + n_cluster entries at most
+        clients, probs, ptr = [], [], [0]
+        for k in range(self.n_cluster):
+            first = max(np.searchsorted(bounds, k, side='right') - 1, 0)
+            last = min(np.searchsorted(bounds, k + 1, side='left'), len(weights))
+            overlap = np.minimum(bounds[first + 1: last + 1], k + 1) - np.maximum(bounds[first: last], k)
+            keep = overlap > 0
+            clients.append(ordered_client_idx[first: last][keep])
+            probs.append(overlap[keep] / overlap[keep].sum())
+            ptr.append(ptr[-1] + keep.sum())
+        self.cluster_ptr = np.array(ptr)
+        self.cluster_clients = np.concatenate(clients)
+        self.cluster_probs = np.concatenate(probs)
+        self.alias_prob, self.alias_idx = self.build_alias_tables(self.cluster_ptr, self.cluster_probs)
+
+    @staticmethod
+    def build_alias_tables(ptr, probs):
+        """
+        Vose alias tables of the distributions probs[ptr[k]: ptr[k+1]]:
+        entry j of a cluster is drawn with probability alias_prob[j],
+        else entry alias_idx[j] (both relative to the start of the cluster)
+        """
+        alias_prob = np.ones(len(probs))
+        alias_idx = np.zeros(len(probs), dtype=int)
+        for k in range(len(ptr) - 1):
+            size = ptr[k + 1] - ptr[k]
+            scaled = probs[ptr[k]: ptr[k + 1]] * size
+            small = [j for j in range(size) if scaled[j] < 1]
+            large = [j for j in range(size) if scaled[j] >= 1]
+            while small and large:
+                j, l = small.pop(), large.pop()
+                alias_prob[ptr[k] + j] = scaled[j]
+                alias_idx[ptr[k] + j] = l
+                scaled[l] -= 1 - scaled[j]
+                (small if scaled[l] < 1 else large).append(l)
+            # leftovers are 1 up to rounding errors: kept with probability 1
+        return alias_prob, alias_idx
 
     def select(self, n, client_idxs, metric=None):
-        #selected_client_idxs = [int(np.random.choice(self.total, 1, p=self.distri_clusters[k])) for k in range(n)]
-        selected_client_idxs = []
+        starts, sizes = self.cluster_ptr[:n], np.diff(self.cluster_ptr)[:n]
+        if len(client_idxs) == self.total:
+            # O(1) per cluster with the alias tables
+            u = np.random.random_sample(n) * sizes
+            entry = np.minimum(u.astype(int), sizes - 1)
+            accept = u - entry < self.alias_prob[starts + entry]
+            entry = np.where(accept, entry, self.alias_idx[starts + entry])
+            return self.cluster_clients[starts + entry]
+
+        # only some clients are available: renormalize each cluster over them
+        available = np.zeros(self.total, dtype=bool)
+        available[client_idxs] = True
+        selected_client_idxs = np.zeros(n, dtype=int)
         for k in range(n):
-            weight = np.take(self.distri_clusters[k], client_idxs)
-            selected_client_idxs.append(int(np.random.choice(client_idxs, 1, p=weight/sum(weight))))
-        return np.array(selected_client_idxs)
+            clients = self.cluster_clients[starts[k]: starts[k] + sizes[k]]
+            weight = self.cluster_probs[starts[k]: starts[k] + sizes[k]] * available[clients]
+            if not weight.any():
+                # no client of the cluster is available: draw from all the
+                # available clients in proportion to their data size
+                clients = np.asarray(client_idxs)
+                weight = self.weights[clients]
+            cdf = np.cumsum(weight)
+            selected_client_idxs[k] = clients[np.searchsorted(cdf, np.random.random_sample() * cdf[-1], side='right')]
+        return selected_client_idxs
 
 
 
@@ -91,7 +131,7 @@ class ClusteredSampling2(ClientSelection):
         # sample clients
         selected_client_idxs = np.zeros(n, dtype=int)
         for k in range(n):
-            selected_client_idxs[k] = int(np.random.choice(client_idxs, 1, p=distri_clusters[k]))
+            selected_client_idxs[k] = np.random.choice(client_idxs, p=distri_clusters[k])
             #weight = np.take(distri_clusters[k], client_idxs)
             #selected_client_idxs[k] = int(np.random.choice(client_idxs, 1, p=weight/sum(weight)))
         #selected_client_idxs = np.take(client_idxs, selected_client_idxs)
@@ -109,90 +149,44 @@ class ClusteredSampling2(ClientSelection):
         return the `representative gradient` formed by the difference
         between the local work and the sent global model
         """
-        local_model_params = []
-        for model in local_models:
-            local_model_params += [[tens.detach().to(self.device) for tens in list(model.parameters())]] #.numpy()
-
-        global_model_params = [tens.detach().to(self.device) for tens in list(global_m.parameters())]
-
-        local_model_grads = []
-        for local_params in local_model_params:
-            local_model_grads += [[local_weights - global_weights
-                                   for local_weights, global_weights in
-                                   zip(local_params, global_model_params)]]
-
-        return local_model_grads
+        global_flat = self.flatten_params(global_m)
+        return self.sketch_deltas(global_flat, local_models)
 
     def get_matrix_similarity_from_grads(self, local_model_grads, distance_type):
         """
         return the similarity matrix where the distance chosen to
         compare two clients is set with `distance_type`
         """
-        n_clients = len(local_model_grads)
-
-        #metric_matrix = np.zeros((n_clients, n_clients))
-        metric_matrix = torch.zeros((n_clients, n_clients))
-        for i, j in tqdm(product(range(n_clients), range(n_clients)), desc='>> similarity', ncols=80):
-            metric_matrix[i, j] = self.get_similarity(
-                local_model_grads[i], local_model_grads[j], distance_type)
-
-        return metric_matrix
-
-    def get_similarity(self, grad_1, grad_2, distance_type="L1"):
-        if distance_type == "L1":
-            norm = 0
-            for g_1, g_2 in zip(grad_1, grad_2):
-                #norm += np.sum(np.abs(g_1 - g_2))
-                norm += torch.sum(torch.abs(g_1 - g_2))
-            return norm.cpu().data
-
-        elif distance_type == "L2":
-            norm = 0
-            for g_1, g_2 in zip(grad_1, grad_2):
-                norm += np.sum((g_1 - g_2) ** 2)
-            return norm
-
-        elif distance_type == "cosine":
-            norm, norm_1, norm_2 = 0, 0, 0
-            print(grad_1[0].squeeze().shape, grad_2[0].squeeze().shape)
-            for i in range(len(grad_1)):
-                norm += np.sum(torch.mul(grad_1[i].squeeze(), grad_2[i].squeeze()))
-                norm_1 += np.sum(grad_1[i] ** 2)
-                norm_2 += np.sum(grad_2[i] ** 2)
-
-            if norm_1 == 0.0 or norm_2 == 0.0:
-                return 0.0
-            else:
-                norm /= np.sqrt(norm_1 * norm_2)
-                return np.arccos(norm)
+        return pairwise_distances(local_model_grads, distance_type).cpu()
 
     def get_clusters_with_alg2(self, linkage_matrix: np.array, n_sampled: int, weights: np.array):
         """Algorithm 2"""
         epsilon = int(10 ** 10)
+        n_clients = len(weights)
 
         # associate each client to a cluster
         link_matrix_p = deepcopy(linkage_matrix)
-        augmented_weights = deepcopy(weights)
-
+        augmented_weights = np.empty(n_clients + len(link_matrix_p))
+        augmented_weights[:n_clients] = weights
         for i in range(len(link_matrix_p)):
             idx_1, idx_2 = int(link_matrix_p[i, 0]), int(link_matrix_p[i, 1])
-
-            new_weight = np.array(
-                [augmented_weights[idx_1] + augmented_weights[idx_2]])
-            augmented_weights = np.concatenate((augmented_weights, new_weight))
-            link_matrix_p[i, 2] = int(new_weight * epsilon)
+            augmented_weights[n_clients + i] = augmented_weights[idx_1] + augmented_weights[idx_2]
+        link_matrix_p[:, 2] = (augmented_weights[n_clients:] * epsilon).astype(int)
 
         clusters = fcluster(
             link_matrix_p, int(epsilon / n_sampled), criterion="distance")
 
         n_clients, n_clusters = len(clusters), len(set(clusters))
 
+        # clients grouped by cluster label (1, ..., n_clusters), in increasing index order
+        by_cluster = np.argsort(clusters, kind='stable')
+        cluster_start = np.concatenate([[0], np.cumsum(np.bincount(clusters, minlength=n_clusters + 1)[1:])])
+
         # Associate each cluster to its number of clients in the cluster
+        pop_weights = (weights * epsilon * n_sampled).astype(np.int64)
         pop_clusters = np.zeros((n_clusters, 2)).astype(int)
-        for i in range(n_clusters):
-            pop_clusters[i, 0] = i + 1
-            for client in np.where(clusters == i + 1)[0]:
-                pop_clusters[i, 1] += int(weights[client] * epsilon * n_sampled)
+        pop_clusters[:, 0] = np.arange(1, n_clusters + 1)
+        np.add.at(pop_clusters[:, 1], clusters - 1, pop_weights)
 
         pop_clusters = pop_clusters[pop_clusters[:, 1].argsort()]
 
@@ -201,31 +195,38 @@ class ClusteredSampling2(ClientSelection):
         # n_sampled biggest clusters that will remain unchanged
         kept_clusters = pop_clusters[n_clusters - n_sampled :, 0]
 
-        for idx, cluster in enumerate(kept_clusters):
-            for client in np.where(clusters == cluster)[0]:
-                distri_clusters[idx, client] = int(
-                    weights[client] * n_sampled * epsilon)
+        row_of_cluster = np.full(n_clusters + 1, -1)
+        row_of_cluster[kept_clusters] = np.arange(len(kept_clusters))
+        kept = row_of_cluster[clusters] >= 0
+        distri_clusters[row_of_cluster[clusters[kept]], kept.nonzero()[0]] = \
+            (weights[kept] * n_sampled * epsilon).astype(np.int64)
 
-        k = 0
+        # the clients of the other clusters, each cluster shuffled, fill the
+        # remaining capacity of the rows in turn: client j covers
+        # [client_end[j-1], client_end[j]) and row k [row_end[k-1], row_end[k])
+        stream = []
         for j in pop_clusters[: n_clusters - n_sampled, 0]:
-            clients_in_j = np.where(clusters == j)[0]
+            clients_in_j = by_cluster[cluster_start[j - 1]: cluster_start[j]].copy()
             np.random.shuffle(clients_in_j)
-
-            for client in clients_in_j:
-                weight_client = int(weights[client] * epsilon * n_sampled)
-
-                while weight_client > 0:
-                    sum_proba_in_k = np.sum(distri_clusters[k])
-                    u_i = min(epsilon - sum_proba_in_k, weight_client)
-                    distri_clusters[k, client] = u_i
-                    weight_client += -u_i
-                    sum_proba_in_k = np.sum(distri_clusters[k])
-                    if sum_proba_in_k == 1 * epsilon:
-                        k += 1
+            stream.append(clients_in_j)
+        stream = np.concatenate(stream) if stream else np.zeros(0, dtype=int)
+        stream = stream[pop_weights[stream] > 0]
+        client_end = np.cumsum(pop_weights[stream])
+        client_begin = client_end - pop_weights[stream]
+        row_end = np.cumsum(epsilon - distri_clusters.sum(1))
+        row_begin = row_end - (epsilon - distri_clusters.sum(1))
+
+        first_row = np.searchsorted(row_end, client_begin, side='right')
+        n_rows = np.searchsorted(row_end, client_end, side='left') - first_row + 1
+        entry_client = np.repeat(np.arange(len(stream)), n_rows)
+        entry_row = np.repeat(first_row, n_rows) + np.arange(n_rows.sum()) - np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+        overlap = np.minimum(client_end[entry_client], row_end[entry_row]) - \
+            np.maximum(client_begin[entry_client], row_begin[entry_row])
+        distri_clusters[entry_row, stream[entry_client]] = overlap
 
         distri_clusters = distri_clusters.astype(float)
         print(distri_clusters.shape)
         for l in range(n_sampled):
             distri_clusters[l] /= np.sum(distri_clusters[l])
 
-        return distri_clusters
\ No newline at end of file
+        return distri_clusters
@@ -18,9 +18,30 @@ NEED_INIT_METHOD = ['Cluster2', 'OCS', 'DivFL', 'PBFL', "Cosin"]
 CANDIDATE_SELECTION_METHOD = ['Pow-d', 'Powd_baseline0', 'Powd_baseline1', 'Powd_baseline2']
 
 
+# methods selecting on local losses, which can be probed with the global model instead
+LOSS_PROBE_METHOD = ['Pow-d']
+
+
+# methods consuming the per-sample outputs of the last local epoch (`--capture_outputs`)
+CAPTURE_OUTPUTS_METHOD = ['FedCorr']
+
+
 NEED_LOCAL_MODELS_METHOD = ['GradNorm', 'GradSim', 'GradCosSim', 'OCS', 'DivFL']
 
 
+# methods reading the gradients of the last local step off the local models,
+# which only in-process trainers leave on them
+NEED_LOCAL_GRADS_METHOD = ['GradNorm']
+
+
+# methods consuming the local models after aggregation (post_update)
+POST_UPDATE_METHOD = ['PBFL', 'Cosin']
+
+
+# methods consuming the global test result of round t to select in round t+1
+NEED_GLOBAL_TEST_METHOD = ['PBFL', 'Cosin']
+
+
 LOSS_THRESHOLD = ['LossCurr']
 
 
@@ -9,8 +9,8 @@ import numpy as np
 import math
 import torch
 from copy import deepcopy
-from tqdm import tqdm
-from itertools import product
+
+from .pairwise import pairwise_distances
 
 from utils import logger
 
@@ -34,48 +34,31 @@ class DivFL(ClientSelection):
         '''
         ---
         Args
-            metric: local_gradients
+            metric: local_gradients (rows of `local_model_metric`)
         '''
-        # get clients' gradients
-        local_grads = self.get_gradients(self.prev_global_m, metric)
         # get clients' dissimilarity matrix
-        self.norm_diff = self.get_matrix_similarity_from_grads(local_grads).cpu().detach().numpy()
+        self.norm_diff = self.get_matrix_similarity_from_grads(metric).cpu().detach().numpy()
         # stochastic greedy
         selected_clients = self.lazy_greedy(len(client_idxs), n)
         return list(selected_clients)
 
+    def local_model_metric(self, local_models):
+        # get clients' gradients
+        return self.get_gradients(self.prev_global_m, local_models)
+
     def get_gradients(self, global_m, local_models):
         """
         return the `representative gradient` formed by the difference
         between the local work and the sent global model
         """
-        local_model_params = []
-        for model in local_models:
-            local_model_params += [[tens.detach().cpu() for tens in list(model.parameters())]] #.numpy()
-
-        global_model_params = [tens.detach().cpu() for tens in list(global_m.parameters())]
-
-        local_model_grads = []
-        for local_params in local_model_params:
-            local_model_grads += [[local_weights - global_weights
-                                   for local_weights, global_weights in
-                                   zip(local_params, global_model_params)]]
-
-        return local_model_grads
+        global_flat = self.flatten_params(global_m, device='cpu')
+        return self.sketch_deltas(global_flat, local_models, device='cpu')
 
     def get_matrix_similarity_from_grads(self, local_model_grads):
         """
-        return the similarity matrix where the distance chosen to
-        compare two clients is set with `distance_type`
+        return the matrix of squared L2 distances between clients' gradients
         """
-        n_clients = len(local_model_grads)
-        metric_matrix = torch.zeros((n_clients, n_clients), device=self.device)
-        for i, j in tqdm(product(range(n_clients), range(n_clients)), desc='>> similarity', total=n_clients**2, ncols=80):
-            grad_1, grad_2 = local_model_grads[i], local_model_grads[j]
-            for g_1, g_2 in zip(grad_1, grad_2):
-                metric_matrix[i, j] += torch.sum(torch.square(g_1 - g_2))
-
-        return metric_matrix
+        return pairwise_distances(local_model_grads.to(self.device), 'L2')
 
     def stochastic_greedy(self, num_total_clients, num_select_clients):
         # num_select_clients is the target number of selected clients each round,
@@ -103,67 +86,42 @@ class DivFL(ClientSelection):
             V_set.remove(R_set[i])
         return SUi
     
-    def lazy_greedy(self,num_total_clients,  num_select_clients):
-        # initialize the ground set and the selected set
-        V_set = set(range(num_total_clients))
-        SUi = set()
-
-        S_util = 0
+    def lazy_greedy(self, num_total_clients, num_select_clients):
+        """
+        lazy greedy maximization of the facility-location utility
+        L - sum_k min_{i in S} d(k, i): candidates are visited by decreasing
+        (possibly stale) upper bound of their marginal gain and only
+        re-evaluated until the best fresh gain reaches the next stale bound
+        """
+        # the first client minimizes the total distance to all clients
         marg_util = self.norm_diff.sum(0)
         i = marg_util.argmin()
         L_s0 = 2. * marg_util.max()
         marg_util = L_s0 - marg_util
-        client_min = self.norm_diff[:,i]
-        # print(i)
-        SUi.add(i)
-        V_set.remove(i)
+        client_min = self.norm_diff[:, i]
+        SUi = {i}
         S_util = marg_util[i]
         marg_util[i] = -1.
-        
-        while len(SUi) < num_select_clients:
-            argsort_V = np.argsort(marg_util)[len(SUi):]
-            for ni in range(len(argsort_V)):
-                i = argsort_V[-ni-1]
-                SUi.add(i)
-                client_min_i = np.minimum(client_min, self.norm_diff[:,i])
-                SUi_util = L_s0 - client_min_i.sum()
 
-                marg_util[i] = SUi_util - S_util
-                if ni > 0:
-                    if marg_util[i] < marg_util[pre_i]:
-                        if ni == len(argsort_V) - 1 or marg_util[pre_i] >= marg_util[argsort_V[-ni-2]]:
-                            S_util += marg_util[pre_i]
-                            # print(pre_i, L_s0 - S_util)
-                            SUi.remove(i)
-                            SUi.add(pre_i)
-                            V_set.remove(pre_i)
-                            marg_util[pre_i] = -1.
-                            client_min = client_min_pre_i.copy()
-                            break
-                        else:
-                            SUi.remove(i)
-                    else:
-                        if ni == len(argsort_V) - 1 or marg_util[i] >= marg_util[argsort_V[-ni-2]]:
-                            S_util = SUi_util
-                            # print(i, L_s0 - S_util)
-                            V_set.remove(i)
-                            marg_util[i] = -1.
-                            client_min = client_min_i.copy()
-                            break
-                        else:
-                            pre_i = i
-                            SUi.remove(i)
-                            client_min_pre_i = client_min_i.copy()
-                else:
-                    if marg_util[i] >= marg_util[argsort_V[-ni-2]]:
-                        S_util = SUi_util
-                        # print(i, L_s0 - S_util)
-                        V_set.remove(i)
-                        marg_util[i] = -1.
-                        client_min = client_min_i.copy()
-                        break
-                    else:
-                        pre_i = i
-                        SUi.remove(i)
-                        client_min_pre_i = client_min_i.copy()
+        while len(SUi) < num_select_clients:
+            # selected clients (-1) come first; equal bounds keep the order of
+            # np.argsort, which mutual nearest clients often tie on
+            candidates = np.argsort(marg_util)[len(SUi):][::-1]
+            best = None
+            for ni, j in enumerate(candidates):
+                client_min_j = np.minimum(client_min, self.norm_diff[:, j])
+                SUj_util = L_s0 - client_min_j.sum()
+                marg_util[j] = SUj_util - S_util
+                # on ties the last evaluated candidate wins
+                if best is None or marg_util[j] >= marg_util[best[0]]:
+                    best = (j, SUj_util, client_min_j)
+                if ni == len(candidates) - 1 or marg_util[best[0]] >= marg_util[candidates[ni + 1]]:
+                    break
+            i, SUi_util, client_min = best
+            if i == j:
+                S_util = SUi_util
+            else:
+                S_util += marg_util[i]
+            SUi.add(i)
+            marg_util[i] = -1.
         return SUi
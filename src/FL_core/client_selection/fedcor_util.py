@@ -6,6 +6,8 @@ from scipy.spatial.distance import cdist
 
 from utils import logger
 
+from ..trainer import elementwise_outputs
+
 def add_noise(args, y_train, dict_users):
     np.random.seed(args.seed)
 
@@ -29,47 +31,40 @@ def add_noise(args, y_train, dict_users):
     return (y_train_noisy, gamma_s, real_noise_level)
 
 
-def get_output(loader, net, args, latent=False, criterion=None):
+def get_output(loader, net, args, latent=False, criterion=None, half=False):
     net.eval()
-    torch.backends.cudnn.deterministic = True
-    torch.backends.cudnn.benchmark = False
-    with torch.no_grad():
-        for i, (images, labels) in enumerate(loader):
-            images = images.to(args.device)
-            labels = labels.to(args.device)
-            labels = labels.long()
-            if latent == False:
-                outputs = net(images)
-                outputs = F.softmax(outputs, dim=1)
-            else:
-                outputs = net(images, True)
-            loss = criterion(outputs, labels)
-            if i == 0:
-                output_whole = np.array(outputs.cpu())
-                loss_whole = np.array(loss.cpu())
-            else:
-                output_whole = np.concatenate((output_whole, outputs.cpu()), axis=0)
-                loss_whole = np.concatenate((loss_whole, loss.cpu()), axis=0)
-    if criterion is not None:
-        return output_whole, loss_whole
+    if latent == False:
+        forward = lambda images: F.softmax(net(images), dim=1)
     else:
-        return output_whole
+        forward = lambda images: net(images, True)
+    num_samples = len(loader.sampler) if hasattr(loader, 'sampler') else loader.num_samples
+    return elementwise_outputs(forward, loader, num_samples, args.device, criterion=criterion, half=half)
+
 
+# bytes of one block of distances (and of its partition)
+LID_BLOCK_BYTES = 64 * 1024 ** 2
 
-def lid_term(X, batch, k=20):
+
+def lid_term(X, batch, k=20, block_bytes=LID_BLOCK_BYTES):
+    """
+    local intrinsic dimensionality of every row of X, from its distances
+    to its k nearest rows of `batch` (the nearest one, itself, excluded)
+    ---
+    The distances are computed in blocks of rows, and only the k + 1
+    smallest ones of each row are sorted (np.partition), so the memory is
+    bounded by `block_bytes` instead of growing with len(X) x len(batch).
+    """
     eps = 1e-6
     X = np.asarray(X, dtype=np.float32)
 
     batch = np.asarray(batch, dtype=np.float32)
-    f = lambda v: - k / (np.sum(np.log(v / (v[-1]+eps) + eps))+eps)
-    distances = cdist(X, batch)
-
-    # get the closest k neighbours
-    sort_indices = np.apply_along_axis(np.argsort, axis=1, arr=distances)[:, 1:k + 1]
-    m, n = sort_indices.shape
-    idx = np.ogrid[:m, :n]
-    idx[1] = sort_indices
-    # sorted matrix
-    distances_ = distances[tuple(idx)]
-    lids = np.apply_along_axis(f, axis=1, arr=distances_)
+    # number of neighbours kept, fewer when the batch is small
+    kk = min(k, len(batch) - 1)
+    step = max(1, block_bytes // (2 * 8 * max(len(batch), 1)))
+    lids = np.empty(len(X))
+    for start in range(0, len(X), step):
+        distances = cdist(X[start: start + step], batch)
+        # get the closest k neighbours, sorted
+        distances_ = np.sort(np.partition(distances, kk, axis=1)[:, :kk + 1], axis=1)[:, 1:]
+        lids[start: start + step] = - k / (np.sum(np.log(distances_ / (distances_[:, -1:] + eps) + eps), axis=1) + eps)
     return lids
@@ -205,7 +205,11 @@ class FedCorr(ClientSelection):
             ### warmup phase
             for client_id in engaged_client_indices:
                 client = self.server.client_list[client_id]
-                output_array, loss_array = client.elementwise_test(self.server.global_model, test_on_training_data=True)
+                # reuse the outputs captured during local training when available
+                captured = client.trainer.captured_outputs()
+                if captured is None:
+                    captured = client.elementwise_test(self.server.global_model, test_on_training_data=True)
+                output_array, loss_array = captured
                 self.warmup_sub_iter_summary(client_id, output_array, loss_array)
             
             if self.warmup_iter_end:
@@ -10,15 +10,16 @@ class GradNorm(ClientSelection):
     def __init__(self, total, device):
         super().__init__(total, device)
 
-    def select(self, n, client_idxs, metric, round=0, results=None):
-        local_models = metric
+    def local_model_metric(self, local_models):
         confs = []
         for local_model in local_models:
             local_grad = local_model.linear_2.weight.grad.data #head.conv.weight.grad.data
             local_grad_norm = torch.sum(torch.abs(local_grad)).cpu().numpy()
             confs.append(local_grad_norm)
+        return np.array(confs).reshape(-1)
 
-        ood_scores = np.array(confs).reshape(-1)
+    def select(self, n, client_idxs, metric, round=0, results=None):
+        ood_scores = np.asarray(metric).reshape(-1)
         # high uncertainty (high ood score)
         selected_client_idxs = np.argsort(ood_scores)[-n:]
         return selected_client_idxs.astype(int)
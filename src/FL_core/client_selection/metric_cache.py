@@ -0,0 +1,71 @@
+'''
+Per-client cache of the selection metrics of post-selection methods.
+
+Post-selection methods select from the metrics (local losses, update
+sketches, ...) of trained clients. With a cache, a client's metric from
+its last training is reused for up to `staleness` rounds, so only the
+candidates with a missing or stale metric, plus the selected ones, are
+trained in a round.
+'''
+import numpy as np
+import torch
+
+
+class MetricCache:
+    def __init__(self, total, staleness):
+        """
+        selection metrics of `total` clients
+        ---
+        Args
+            total: number of clients
+            staleness: number of rounds a cached metric stays usable
+        """
+        self.total = total
+        self.staleness = staleness
+        self.values = None  # allocated with the shape/type of the first metrics
+        self.loss = np.full(total, np.nan)
+        self.last_round = np.full(total, -1, dtype=int)
+
+    def stale(self, client_idxs, round_idx):
+        """
+        clients (in the given order) with no metric or one older than `staleness` rounds
+        """
+        client_idxs = np.asarray(client_idxs, dtype=int)
+        last = self.last_round[client_idxs]
+        return client_idxs[(last < 0) | (round_idx - last > self.staleness)].tolist()
+
+    def update(self, client_idxs, metrics, losses, round_idx):
+        """
+        record the metrics (a sequence of scalars, or of rows as a tensor)
+        and losses of freshly trained clients
+        """
+        if len(client_idxs) == 0:
+            return
+        client_idxs = np.asarray(client_idxs, dtype=int)
+        if self.values is None:
+            if isinstance(metrics, torch.Tensor):
+                self.values = torch.zeros((self.total,) + tuple(metrics.shape[1:]), dtype=metrics.dtype)
+            else:
+                self.values = np.full((self.total,) + np.shape(metrics)[1:], np.nan)
+        if isinstance(self.values, torch.Tensor):
+            self.values[torch.from_numpy(client_idxs)] = metrics.to(self.values.device)
+        else:
+            self.values[client_idxs] = np.asarray(metrics, dtype=float)
+        self.loss[client_idxs] = losses
+        self.last_round[client_idxs] = round_idx
+
+    def get(self, client_idxs):
+        """
+        cached metrics of the given clients, in their order
+        """
+        client_idxs = np.asarray(client_idxs, dtype=int)
+        if isinstance(self.values, torch.Tensor):
+            return self.values[torch.from_numpy(client_idxs)]
+        return self.values[client_idxs]
+
+    def state_dict(self):
+        return {k: v.clone() if isinstance(v, torch.Tensor) else v.copy() if isinstance(v, np.ndarray) else v
+                for k, v in vars(self).items()}
+
+    def load_state_dict(self, state):
+        self.__dict__.update(state)
@@ -0,0 +1,70 @@
+'''
+Pairwise distances between flattened client gradients.
+
+The (clients x clients) matrix is computed in blocks of rows, each block
+with a few matrix operations, so the peak extra memory stays within a
+budget instead of growing with clients^2 x params.
+'''
+import torch
+
+
+# bytes of one block of the distance matrix and of its temporaries
+DEFAULT_BLOCK_BYTES = 256 * 1024 ** 2
+
+
+def _block_rows(n_rows, n_cols, block_bytes):
+    # float64 block + a few same-sized temporaries
+    return max(1, min(n_rows, block_bytes // (4 * 8 * max(n_cols, 1))))
+
+
+def _chunks(n_rows, row_numel, block_bytes):
+    # (start, end) of chunks of rows whose float64 copy fits in the budget
+    step = max(1, block_bytes // (8 * max(row_numel, 1)))
+    return [(start, min(start + step, n_rows)) for start in range(0, n_rows, step)]
+
+
+def pairwise_distances(grads, distance_type='L1', block_bytes=DEFAULT_BLOCK_BYTES):
+    """
+    distance between every pair of rows of `grads`
+    ---
+    Args
+        grads: (clients x params) matrix of flattened gradients
+        distance_type: 'L1' (sum of absolute differences), 'L2' (sum of
+            squared differences) or 'cosine' (angle in radians; 0 when
+            either gradient is zero)
+        block_bytes: memory budget of one block of rows
+    Return
+        (clients x clients) float32 matrix on the device of `grads`
+    """
+    n_clients = grads.shape[0]
+    out = torch.empty((n_clients, n_clients), dtype=torch.float32, device=grads.device)
+    step = _block_rows(n_clients, n_clients, block_bytes)
+    if distance_type in ('L2', 'cosine'):
+        # Gram-matrix forms are accumulated in float64 to limit cancellation;
+        # rows are cast in chunks (half the budget for the rows of a block,
+        # half for the columns), never the whole matrix at once
+        chunks = _chunks(n_clients, grads.shape[1], block_bytes // 2)
+        step = min(step, chunks[0][1])
+        sq_norms = torch.cat([grads[s:e].double().pow(2).sum(1) for s, e in chunks])
+    elif distance_type != 'L1':
+        raise ValueError(f'Unknown distance type {distance_type}')
+
+    for start in range(0, n_clients, step):
+        end = min(start + step, n_clients)
+        if distance_type == 'L1':
+            block = torch.cdist(grads[start:end].unsqueeze(0), grads.unsqueeze(0), p=1)[0]
+        else:
+            rows64 = grads[start:end].double()
+            block = torch.cat([rows64 @ grads[s:e].double().t() for s, e in chunks], dim=1)
+        if distance_type == 'L2':
+            # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b
+            block.mul_(-2).add_(sq_norms[start:end, None]).add_(sq_norms[None, :]).clamp_(min=0)
+            rows = torch.arange(start, end, device=grads.device)
+            block[rows - start, rows] = 0
+        elif distance_type == 'cosine':
+            norms = sq_norms.sqrt()
+            block.div_(norms[start:end, None] * norms[None, :]).clamp_(-1, 1).arccos_()
+            zero = (norms[start:end, None] == 0) | (norms[None, :] == 0)
+            block.masked_fill_(zero, 0.)
+        out[start:end] = block
+    return out
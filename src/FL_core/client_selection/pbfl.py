@@ -1,4 +1,6 @@
 from .client_selection import ClientSelection
+from .bandit_state import BanditState, top_n
+from .reward_kernel import segment_ids, layer_projections
 import numpy as np
 import math
 import torch
@@ -15,12 +17,8 @@ class Proj_Bandit(ClientSelection):
     def __init__(self, args, total, device):
         super().__init__(total, device)
 
-        self.client2rewards = []
-        for _ in range(total):
-            self.client2rewards.append([0])
-        self.client2proj = np.array([-math.inf] * total)
-
-        self.client2selected_cnt = np.array([0] * total)
+        # rewards and selection counts of every client
+        self.bandit = BanditState(total, window=args.bandit_window, discount=args.bandit_discount)
         self.client_update_cnt = 0
         self.total = total
 
@@ -60,7 +58,7 @@ class Proj_Bandit(ClientSelection):
     
     def signal_handler(self, *args):
         print()
-        print(self.client2selected_cnt)
+        print(self.bandit.selected_cnt)
         sys.exit(0)
     
     def setup(self, n_samples):
@@ -68,58 +66,35 @@ class Proj_Bandit(ClientSelection):
         self.loss_per_update = [self.global_loss]
 
     def init(self, global_m, l=None):
-        self.prev_global_params = deepcopy([tens.detach().to(self.device) for tens in list(global_m.parameters())])
+        self.prev_global_flat = self.flatten_params(global_m)
 
     def update_proj_list(self, selected_client_idxs, global_m, local_models, improved):
         """
         return the `projected gradient` 
         """
+        global_grad = self.sketch_flat(self.flatten_params(global_m) - self.prev_global_flat)
+        local_model_grads = self.sketch_deltas(self.prev_global_flat, local_models)
 
-        local_model_params = []
-        for model in local_models:
-            local_model_params.append([tens.detach().to(self.device) for tens in list(model.parameters())]) #.numpy()
-        
-        prev_global_model_params = self.prev_global_params
-        global_model_params = [tens.detach().to(self.device) for tens in list(global_m.parameters())]
-        global_grad = [(global_weights - prev_global_weights).flatten()
-                                   for global_weights, prev_global_weights in
-                                   zip(global_model_params, prev_global_model_params)]
-
-        local_model_grads = []
-        for local_params in local_model_params:
-            local_model_grads.append([(local_weights - prev_global_weights).flatten()
-                                   for local_weights, prev_global_weights in
-                                   zip(local_params, prev_global_model_params)])
-
-        idxs_proj = []
-        grad_norm = [torch.sqrt(torch.sum(global_grad_per_key**2)) for global_grad_per_key in global_grad]
-        for local_grad in local_model_grads:
-            proj_list = []
-            for local_grad_per_key, global_grad_per_key, grad_norm_per_key in zip(local_grad, global_grad, grad_norm):
-                proj_list.append(torch.dot(local_grad_per_key, global_grad_per_key) / grad_norm_per_key)
-            idxs_proj.append(torch.mean(torch.Tensor(proj_list)))
+        segments = list(self.delta_segments())
+        idxs_proj = layer_projections(local_model_grads, global_grad,
+                                      segment_ids(segments), len(segments)).mean(1).cpu()
 
         # import pdb; pdb.set_trace()
-        final_reward = torch.nn.Softmax(dim=0)(torch.Tensor(idxs_proj)) * improved
+        final_reward = torch.nn.Softmax(dim=0)(idxs_proj) * improved
         # print("projection after softmax", final_reward)
-        for client_idx, reward in zip(selected_client_idxs, (final_reward)):
-            self.client2rewards[client_idx].append((reward))
-
-        for client_idx in range(len(self.client2proj)):
-            self.client2proj[client_idx] = np.mean(self.client2rewards[client_idx])
+        self.bandit.add_rewards(selected_client_idxs, final_reward.numpy())
     
     def get_ucb(self, step):
-        # momemtum_based_grad_proj = self.client2proj
-        # print("Proj", momemtum_based_grad_proj)
-        assert isinstance(self.client2proj, list) or isinstance(self.client2proj, np.ndarray)
-        # assert len(self.client2proj) == num_of_client
+        client2proj = self.bandit.means()
         
         alpha = self.ucb_alpha_fn(step)
         if alpha == 0:
-            ucb = self.client2proj
+            ucb = client2proj
         else:
-            ucb = self.client2proj + alpha * np.sqrt(
-                (2 * np.log(self.client_update_cnt))/self.client2selected_cnt)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # never selected clients get an infinite bonus
+                ucb = client2proj + alpha * np.sqrt(
+                    (2 * np.log(self.client_update_cnt))/self.bandit.selected_cnt)
         
         # print("ucb", ucb)
         return ucb
@@ -175,12 +150,10 @@ class Proj_Bandit(ClientSelection):
             # selected_client_index = np.random.choice(self.total, n, replace=False)
         else:
             ucb = self.get_ucb(step=self.client_update_cnt)
-            sorted_client_idxs = ucb.argsort()[::-1]
             ### Select clients
-            selected_client_index = sorted_client_idxs[:n]
+            selected_client_index = top_n(ucb, n)
             
-        for client_idx in selected_client_index:
-            self.client2selected_cnt[client_idx] += 1
+        self.bandit.add_selections(selected_client_index)
         self.client_update_cnt += 1
 
         return selected_client_index.astype(int)
\ No newline at end of file
@@ -0,0 +1,56 @@
+'''
+Batched per-layer reward statistics of PBFL and Cosin.
+
+The per-layer dot products and squared norms of all clients' deltas with
+the global delta are segment reductions (`index_add_` over a layer id per
+coordinate) of elementwise products of the stacked deltas, so one pass
+covers every client and every layer.
+'''
+import torch
+
+
+def segment_ids(segments, device='cpu'):
+    """
+    layer id of every coordinate of a flat buffer with the given
+    (offset, numel) segments, which must tile the buffer in order
+    """
+    numels = torch.tensor([numel for _, numel in segments], device=device)
+    return torch.repeat_interleave(torch.arange(len(numels), device=device), numels)
+
+
+def layer_stats(deltas, global_delta, seg_ids, num_layers):
+    """
+    per-layer inner products and squared norms
+    ---
+    Args
+        deltas: (clients x numel) stacked client deltas
+        global_delta: (numel,) global delta
+        seg_ids: layer id of every coordinate, from `segment_ids`
+        num_layers: number of layers
+    Return
+        dots (clients x layers), local squared norms (clients x layers),
+        global squared norms (layers,)
+    """
+    global_delta = global_delta.to(deltas.device)
+    seg_ids = seg_ids.to(deltas.device)
+    dots = deltas.new_zeros((len(deltas), num_layers)).index_add_(1, seg_ids, deltas * global_delta)
+    local_sq = deltas.new_zeros((len(deltas), num_layers)).index_add_(1, seg_ids, deltas * deltas)
+    global_sq = deltas.new_zeros(num_layers).index_add_(0, seg_ids, global_delta * global_delta)
+    return dots, local_sq, global_sq
+
+
+def layer_projections(deltas, global_delta, seg_ids, num_layers):
+    """
+    projection of every client's delta on the global delta, per layer
+    """
+    dots, _, global_sq = layer_stats(deltas, global_delta, seg_ids, num_layers)
+    return dots / global_sq.sqrt()
+
+
+def layer_cosines(deltas, global_delta, seg_ids, num_layers, eps=1e-8):
+    """
+    cosine similarity of every client's delta with the global delta, per
+    layer; norms are clamped to `eps` as in `F.cosine_similarity`
+    """
+    dots, local_sq, global_sq = layer_stats(deltas, global_delta, seg_ids, num_layers)
+    return dots / (local_sq.sqrt().clamp(min=eps) * global_sq.sqrt().clamp(min=eps))
@@ -0,0 +1,170 @@
+'''
+Cohort training: local SGD of several clients as one batched computation.
+
+The parameters of K clients are stacked along a leading client dimension
+and every local step runs `vmap` over `torch.func.functional_call`, so
+10-50 tiny per-client loops become one batched forward/backward per step.
+Each client keeps its own sample order (the one `Trainer.train` draws
+from `Client.next_shuffle_seed` with `--seeded_shuffle`), its own momentum
+buffer and its own number of steps; the last, smaller batch of a client
+is zero-padded and masked out of the loss. For models without stochastic layers this is the
+same computation as training the clients one by one; dropout masks are
+drawn independently per client.
+'''
+from copy import deepcopy
+import torch
+import torch.nn.functional as F
+from torch.func import functional_call, grad_and_value, vmap
+
+from .client_selection.config import NEED_LOCAL_GRADS_METHOD
+
+
+class CohortTrainer:
+    def __init__(self, args, model):
+        """
+        vectorized local training of a cohort of clients
+        ---
+        Args
+            args: arguments for overall FL training
+            model: model whose architecture the clients share
+        """
+        self.args = args
+        self.device = args.device
+        self.num_epoch = args.num_epoch
+        self.num_updates = args.num_updates
+        self.batch_size = args.batch_size
+        self.momentum = args.momentum
+        self.wdecay = args.wdecay
+
+        self.names = [name for name, _ in model.named_parameters()]
+        self.step = vmap(grad_and_value(self._loss, has_aux=True), randomness='different')
+        self.model = None
+
+    @staticmethod
+    def supports(model, args):
+        """
+        cohort training covers plain SGD on models without buffers
+        (batch statistics would mix the padded samples in), for selection
+        methods that do not read gradients off the local models
+        """
+        return (args.client_optimizer == 'sgd' and args.num_epoch > 0
+                and len(list(model.buffers())) == 0
+                and args.method not in NEED_LOCAL_GRADS_METHOD)
+
+    def _loss(self, params, input, labels, mask):
+        output = functional_call(self.model, params, (input,))
+        losses = F.cross_entropy(output, labels.long(), reduction='none')
+        num_samples = mask.sum()
+        loss = (losses * mask).sum() / num_samples.clamp(min=1)
+        _, preds = torch.max(output.detach(), 1)
+        correct = (preds.eq(labels) * mask).sum()
+        return loss, (loss.detach() * num_samples, correct)
+
+    def _schedule(self, num_samples, shuffle_seed):
+        """
+        (epoch, sample indices) of every local step of one client
+        """
+        generator = torch.Generator()
+        generator.manual_seed(shuffle_seed)
+        steps = []
+        for epoch in range(self.num_epoch):
+            order = torch.randperm(num_samples, generator=generator)
+            batches = order.split(self.batch_size)
+            if self.num_updates is not None:
+                batches = batches[:self.num_updates]
+            steps.extend((epoch, batch) for batch in batches)
+        return steps
+
+    def train(self, global_model, clients):
+        """
+        train a cohort of clients from the global model; the trained models
+        are left in the clients' trainers
+        ---
+        Args
+            global_model: current global model
+            clients: clients of the cohort
+        Return
+            training results in the order of `clients`
+        """
+        num_clients = len(clients)
+        if self.model is None:
+            # template module; its own parameters are never used
+            self.model = deepcopy(global_model).to(self.device)
+        self.model.train()
+        lr = self.args.lr_local
+
+        params = {name: param.detach().to(self.device).unsqueeze(0).repeat(
+                      num_clients, *([1] * param.dim()))
+                  for name, param in global_model.named_parameters()}
+        momentum_buffers = None
+
+        datasets = [client.labeled_data.tensors for client in clients]
+        schedules = [self._schedule(len(labels), client.next_shuffle_seed())
+                     for client, (_, labels) in zip(clients, datasets)]
+        input_shape = datasets[0][0].shape[1:]
+
+        train_loss = torch.zeros(num_clients, device=self.device)
+        correct = torch.zeros(num_clients, device=self.device)
+        total = torch.zeros(num_clients, device=self.device)
+        num_samples = torch.zeros(num_clients, device=self.device)  # over all local epochs
+        for step in range(max(len(schedule) for schedule in schedules)):
+            input = torch.zeros((num_clients, self.batch_size, *input_shape),
+                                dtype=datasets[0][0].dtype, device=self.device)
+            labels = torch.zeros((num_clients, self.batch_size),
+                                 dtype=datasets[0][1].dtype, device=self.device)
+            mask = torch.zeros((num_clients, self.batch_size), device=self.device)
+            active = torch.zeros(num_clients, dtype=torch.bool, device=self.device)
+            last_epoch = torch.zeros(num_clients, dtype=torch.bool, device=self.device)
+            for k, (schedule, (data_x, data_y)) in enumerate(zip(schedules, datasets)):
+                if step >= len(schedule):
+                    continue
+                epoch, batch = schedule[step]
+                input[k, :len(batch)] = data_x[batch].to(self.device)
+                labels[k, :len(batch)] = data_y[batch].to(self.device)
+                mask[k, :len(batch)] = 1
+                active[k] = True
+                last_epoch[k] = epoch == self.num_epoch - 1
+
+            grads, (_, (loss_sum, num_correct)) = self.step(params, input, labels, mask)
+
+            # statistics of the last local epoch, as in Trainer.train
+            train_loss += loss_sum * last_epoch
+            correct += num_correct * last_epoch
+            total += mask.sum(1) * last_epoch
+            num_samples += mask.sum(1)
+
+            # torch.optim.SGD (no dampening, no nesterov) on the active clients
+            update = {}
+            for name in self.names:
+                d_p = grads[name]
+                if self.wdecay != 0:
+                    d_p = d_p.add(params[name], alpha=self.wdecay)
+                update[name] = d_p
+            if self.momentum != 0:
+                if momentum_buffers is None:
+                    momentum_buffers = {name: update[name].clone() for name in self.names}
+                else:
+                    for name in self.names:
+                        _active = active.view(-1, *([1] * (update[name].dim() - 1)))
+                        momentum_buffers[name] = torch.where(
+                            _active, momentum_buffers[name] * self.momentum + update[name],
+                            momentum_buffers[name])
+                update = momentum_buffers
+            for name in self.names:
+                _active = active.view(-1, *([1] * (update[name].dim() - 1)))
+                params[name] = torch.where(_active, params[name] - lr * update[name], params[name])
+
+        train_loss, correct, total, num_samples = train_loss.cpu(), correct.cpu(), total.cpu(), num_samples.cpu()
+        results = []
+        for k, client in enumerate(clients):
+            assert total[k] > 0
+            client.trainer.set_model(global_model)
+            with torch.no_grad():
+                for name, param in client.trainer.model.named_parameters():
+                    param.copy_(params[name][k])
+            client.trainer.model = client.trainer.model.cpu()
+            loss = train_loss[k].item() / total[k].item()
+            result = {'loss': loss, 'acc': correct[k].item() / total[k].item(), 'metric': loss,
+                      'num_samples': int(num_samples[k].item())}
+            results.append(client.scale_metric(result))
+        return results
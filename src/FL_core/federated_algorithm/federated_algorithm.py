@@ -3,6 +3,8 @@ from collections import OrderedDict
 import torch
 import numpy as np
 
+from ..flat_model import FlatLayout
+
 
 class FederatedAlgorithm:
     def __init__(self, train_sizes, init_model):
@@ -11,8 +13,58 @@ class FederatedAlgorithm:
             self.param_keys = init_model.keys()
         else:
             self.param_keys = init_model.cpu().state_dict().keys()
+        self.layout = FlatLayout(init_model)
 
     def update(self, local_models, client_indices, global_model=None):
+        """
+        aggregate all local models of the round at once: the models are
+        stacked into a (clients x numel) matrix and averaged with one
+        matrix-vector product
+        """
+        self.begin_round(client_indices, accumulate=False)
+        local_flats = self.layout.flatten_many(local_models, device='cpu')
+        self.aggregate = torch.mv(local_flats.t(), self.client_weights(client_indices))
+        del local_flats
+        return self.finalize(global_model)
+
+    def client_weights(self, client_indices):
+        """
+        aggregation weights of the clients, proportional to their data size
+        """
+        return torch.tensor([self.train_sizes[idx] / self.num_training_data for idx in client_indices],
+                            dtype=self.layout.dtype)
+
+    def begin_round(self, client_indices, accumulate=True):
+        """
+        start an incremental aggregation over the given clients
+        """
+        self.num_training_data = sum([self.train_sizes[idx] for idx in client_indices])
+        self.aggregate = self.layout.zeros() if accumulate else None
+
+    def add_client_update(self, client_idx, local_model):
+        """
+        fold one local model into the running weighted average; the
+        local model can be freed right after
+        """
+        weight = self.train_sizes[client_idx] / self.num_training_data
+        if getattr(self, 'local_flat', None) is None:
+            self.local_flat = self.layout.empty()
+        self.aggregate.add_(self.layout.flatten(local_model, out=self.local_flat), alpha=weight)
+
+    def finalize(self, global_model=None):
+        """
+        return the aggregated state dict of the round
+        """
+        update_model, self.aggregate = self.aggregate, None
+        return self.layout.unflatten(update_model)
+
+    def state_dict(self):
+        """
+        server optimizer state carried across rounds, for checkpointing
+        """
+        return {}
+
+    def load_state_dict(self, state):
         pass
 
 
@@ -21,20 +73,6 @@ class FedAvg(FederatedAlgorithm):
     def __init__(self, train_sizes, init_model):
         super().__init__(train_sizes, init_model)
 
-    def update(self, local_models, client_indices, global_model=None):
-        num_training_data = sum([self.train_sizes[idx] for idx in client_indices])
-        update_model = OrderedDict()
-        for idx in range(len(client_indices)):
-            local_model = local_models[idx].cpu().state_dict()
-            num_local_data = self.train_sizes[client_indices[idx]]
-            weight = num_local_data / num_training_data
-            for k in self.param_keys:
-                if idx == 0:
-                    update_model[k] = weight * local_model[k]
-                else:
-                    update_model[k] += weight * local_model[k]
-        return update_model
-
 
 class FedAdam(FederatedAlgorithm):
     def __init__(self, train_sizes, init_model, args):
@@ -43,31 +81,23 @@ class FedAdam(FederatedAlgorithm):
         self.beta2 = args.beta2  # 0.999
         self.epsilon = args.epsilon  # 1e-8
         self.lr_global = args.lr_global
-        self.m, self.v = OrderedDict(), OrderedDict()
-        for k in self.param_keys:
-            self.m[k], self.v[k] = 0., 0.
-
-    def update(self, local_models, client_indices, global_model):
-        num_training_data = sum([self.train_sizes[idx] for idx in client_indices])
-        gradient_update = OrderedDict()
-        for idx in range(len(local_models)):
-            local_model = local_models[idx].cpu().state_dict()
-            num_local_data = self.train_sizes[client_indices[idx]]
-            weight = num_local_data / num_training_data
-            for k in self.param_keys:
-                if idx == 0:
-                    gradient_update[k] = weight * local_model[k]
-                else:
-                    gradient_update[k] += weight * local_model[k]
-                torch.cuda.empty_cache()
-
-        global_model = global_model.cpu().state_dict()
-        update_model = OrderedDict()
-        for k in self.param_keys:
-            g = gradient_update[k]
-            self.m[k] = self.beta1 * self.m[k] + (1 - self.beta1) * g
-            self.v[k] = self.beta2 * self.v[k] + (1 - self.beta2) * torch.mul(g, g)
-            m_hat = self.m[k] / (1 - self.beta1)
-            v_hat = self.v[k] / (1 - self.beta2)
-            update_model[k] = global_model[k] - self.lr_global * m_hat / (np.sqrt(v_hat) + self.epsilon)
-        return update_model
+        self.m, self.v = self.layout.zeros(), self.layout.zeros()
+
+    def finalize(self, global_model):
+        g, self.aggregate = self.aggregate, None
+
+        # Adam step in place on the flat buffers:
+        # w -= lr * (m / (1 - beta1)) / (sqrt(v / (1 - beta2)) + eps)
+        update_model = self.layout.flatten(global_model, device='cpu')
+        self.m.mul_(self.beta1).add_(g, alpha=1 - self.beta1)
+        self.v.mul_(self.beta2).addcmul_(g, g, value=1 - self.beta2)
+        denom = g  # reuse the buffer of the aggregate
+        torch.div(self.v, 1 - self.beta2, out=denom).sqrt_().add_(self.epsilon)
+        update_model.addcdiv_(self.m, denom, value=-self.lr_global / (1 - self.beta1))
+        return self.layout.unflatten(update_model)
+
+    def state_dict(self):
+        return {'m': self.m.clone(), 'v': self.v.clone()}
+
+    def load_state_dict(self, state):
+        self.m, self.v = state['m'].clone(), state['v'].clone()
@@ -0,0 +1,115 @@
+'''
+Flat model representation: the tensors of a model laid out in one
+contiguous 1-D buffer, plus a layout index of (name, offset, shape).
+
+Model deltas, norms, dot products and weighted sums then become single
+vectorized ops on the buffer instead of Python loops over layers.
+'''
+from collections import OrderedDict
+import torch
+
+
+class FlatLayout:
+    def __init__(self, model, params_only=False, dtype=torch.float32):
+        """
+        layout index of a model flattened into one 1-D buffer
+        ---
+        Args
+            model: nn.Module or state dict (OrderedDict) to index
+            params_only: index `model.parameters()` only (what selection
+                methods compare), otherwise the whole `state_dict()`
+                (what aggregation averages)
+            dtype: dtype of the flat buffer
+        """
+        self.params_only = params_only
+        self.dtype = dtype
+        self.names, self.shapes, self.offsets, self.numels = [], [], [], []
+        offset = 0
+        for name, tensor in self._named_tensors(model):
+            self.names.append(name)
+            self.shapes.append(tuple(tensor.shape))
+            self.offsets.append(offset)
+            self.numels.append(tensor.numel())
+            offset += tensor.numel()
+        self.numel = offset
+
+    def __len__(self):
+        return len(self.names)
+
+    def _named_tensors(self, model):
+        if isinstance(model, dict):
+            assert not self.params_only, "a state dict does not tell parameters from buffers"
+            return list(model.items())
+        if self.params_only:
+            return list(model.named_parameters())
+        return list(model.state_dict().items())
+
+    def segments(self):
+        """
+        (offset, numel) of each indexed tensor in the flat buffer
+        """
+        return zip(self.offsets, self.numels)
+
+    def empty(self, n=None, device='cpu'):
+        """
+        allocate an uninitialized flat buffer, or `n` stacked buffers
+        """
+        shape = (self.numel,) if n is None else (n, self.numel)
+        return torch.empty(shape, dtype=self.dtype, device=device)
+
+    def zeros(self, n=None, device='cpu'):
+        shape = (self.numel,) if n is None else (n, self.numel)
+        return torch.zeros(shape, dtype=self.dtype, device=device)
+
+    @torch.no_grad()
+    def flatten(self, model, device=None, out=None):
+        """
+        copy the tensors of a model into one flat buffer
+        ---
+        Args
+            model: nn.Module or state dict with this layout
+            device: device of the returned buffer (default: the model's)
+            out: preallocated 1-D buffer to fill in place
+        Return
+            1-D tensor of size `self.numel`
+        """
+        tensors = [tensor for _, tensor in self._named_tensors(model)]
+        assert len(tensors) == len(self.names), (len(tensors), len(self.names))
+        if out is None:
+            out = self.empty(device=tensors[0].device if device is None else device)
+        for tensor, (offset, numel) in zip(tensors, self.segments()):
+            out[offset: offset + numel].copy_(tensor.detach().reshape(-1))
+        return out
+
+    def flatten_many(self, models, device=None):
+        """
+        stack the flat buffers of several models into a (models x numel) matrix
+        """
+        out = self.empty(n=len(models), device='cpu' if device is None else device)
+        for row, model in zip(out, models):
+            self.flatten(model, out=row)
+        return out
+
+    def unflatten(self, flat):
+        """
+        views of a flat buffer, keyed and shaped as the original tensors
+        ---
+        Args
+            flat: 1-D buffer with this layout
+        Return
+            OrderedDict name -> tensor view, loadable with `load_state_dict`
+        """
+        assert flat.numel() == self.numel, (flat.numel(), self.numel)
+        return OrderedDict((name, flat[offset: offset + numel].view(shape))
+                           for name, shape, offset, numel in
+                           zip(self.names, self.shapes, self.offsets, self.numels))
+
+    @torch.no_grad()
+    def copy_to(self, flat, model):
+        """
+        write a flat buffer back into the tensors of a model in place
+        """
+        tensors = [tensor for _, tensor in self._named_tensors(model)]
+        for tensor, view in zip(tensors, self.unflatten(flat).values()):
+            tensor.copy_(view)
+        return model
@@ -0,0 +1,65 @@
+'''
+Forward-only loss probing of candidate clients.
+
+Power-of-Choice only needs the loss of the current global model on each
+candidate's data to pick the clients to train. The (optionally
+subsampled) data of all candidates are concatenated and pushed through
+the model in large no-grad batches, and the per-sample losses are
+summed per client with one `index_add_`.
+'''
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from .packed_eval import dataset_tensors
+
+
+class LossProbe:
+    # samples of one forward batch
+    BATCH_SIZE = 1024
+
+    def __init__(self, args):
+        """
+        Args
+            args: arguments for overall FL training (device, seed, probe_samples)
+        """
+        self.device = args.device
+        self.seed = args.seed
+        self.num_samples = args.probe_samples
+
+    def _subsample(self, client, round_idx):
+        # seeded by (seed, client, round): reproducible, and does not consume the global RNG
+        n = len(client.labeled_data)
+        if self.num_samples is None or self.num_samples >= n:
+            return np.arange(n)
+        rng = np.random.default_rng([self.seed, client.client_idx, round_idx])
+        return np.sort(rng.choice(n, self.num_samples, replace=False))
+
+    @torch.no_grad()
+    def probe(self, model, clients, round_idx):
+        """
+        average loss of `model` on the (subsampled) training data of each client
+        ---
+        Return
+            selection metrics of the clients (rescaled as their training metrics)
+        """
+        inputs, labels, owners = [], [], []
+        for k, client in enumerate(clients):
+            input, label = dataset_tensors(client.labeled_data, self._subsample(client, round_idx))
+            inputs.append(input)
+            labels.append(label)
+            owners.append(torch.full((len(label),), k, dtype=torch.long))
+        inputs, labels, owners = torch.cat(inputs), torch.cat(labels), torch.cat(owners)
+
+        was_training = model.training
+        model.to(self.device).eval()
+        loss_sum = torch.zeros(len(clients), device=self.device)
+        for start in range(0, len(labels), self.BATCH_SIZE):
+            input = inputs[start: start + self.BATCH_SIZE].to(self.device)
+            label = labels[start: start + self.BATCH_SIZE].to(self.device)
+            loss = F.cross_entropy(model(input), label.long(), reduction='none')
+            loss_sum.index_add_(0, owners[start: start + self.BATCH_SIZE].to(self.device), loss)
+        model.train(was_training)
+
+        losses = (loss_sum.cpu() / torch.bincount(owners, minlength=len(clients))).tolist()
+        return [client.scale_metric({'metric': loss})['metric'] for client, loss in zip(clients, losses)]
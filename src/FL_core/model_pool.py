@@ -0,0 +1,72 @@
+'''
+Pool of reusable model instances for the clients' trainers.
+
+Instead of deep-copying the global model for every client of every round,
+trainers borrow an idle instance and refill it in place from the flat
+buffer of the global model broadcast at the start of local training.
+At most `capacity` idle instances are kept; beyond that the least
+recently released one is evicted.
+'''
+from copy import deepcopy
+import threading
+
+
+class ModelPool:
+    def __init__(self, template, layout, capacity):
+        """
+        bounded pool of model instances
+        ---
+        Args
+            template: model to replicate when the pool runs dry
+            layout: FlatLayout of the model's state dict
+            capacity: max number of idle instances kept
+        """
+        self.template = deepcopy(template).cpu()
+        self.layout = layout
+        self.capacity = capacity
+        self.idle = []
+        self.source = None
+        self.source_model = None
+        self.num_created = 0
+        self.lock = threading.Lock()
+
+    def refresh(self, model):
+        """
+        broadcast a new source model; later acquisitions start from it.
+        Call it again whenever the source model changes
+        """
+        self.source = self.layout.flatten(model, device='cpu')
+        self.source_model = model
+
+    def fill(self, pooled, model=None):
+        """
+        overwrite a pooled instance in place with `model`; the broadcast
+        buffer is reused when `model` is None or the refreshed source model
+        """
+        if model is None or model is self.source_model:
+            assert self.source is not None, "broadcast a model with `refresh` first"
+            source = self.source
+        else:
+            source = self.layout.flatten(model, device='cpu')
+        return self.layout.copy_to(source, pooled)
+
+    def acquire(self, model=None):
+        """
+        borrow an instance holding `model` (default: the current source model)
+        """
+        with self.lock:
+            pooled = self.idle.pop() if self.idle else None
+            if pooled is None:
+                pooled = deepcopy(self.template)
+                self.num_created += 1
+        return self.fill(pooled, model)
+
+    def release(self, model):
+        """
+        give an instance back to the pool
+        """
+        with self.lock:
+            self.idle.append(model)
+            if len(self.idle) > self.capacity:
+                # evict the least recently released instance
+                self.idle.pop(0)
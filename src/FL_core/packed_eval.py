@@ -0,0 +1,79 @@
+'''
+Evaluation of one model on the test sets of many clients at once.
+
+The test tensors of all clients are concatenated once into a packed
+buffer with per-client offsets. An evaluation is then a few large no-grad
+forward passes over the buffer, and the per-client loss and accuracy are
+segment reductions (`index_add_`) of the per-sample results over the
+owner of every sample.
+'''
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def dataset_tensors(data, idxs=None):
+    """
+    (inputs, labels) of a dataset (all samples, or the given indices) as tensors
+    """
+    if hasattr(data, 'tensors'):
+        input, labels = data.tensors[:2]
+        return (input, labels) if idxs is None else (input[idxs], labels[idxs])
+    if idxs is None:
+        idxs = range(len(data))
+    input, labels = zip(*[data[i] for i in idxs])
+    return torch.stack(input), torch.as_tensor(np.array(labels))
+
+
+class PackedEvaluator:
+    # samples of one forward batch
+    BATCH_SIZE = 1024
+
+    def __init__(self, datasets, device):
+        """
+        Args
+            datasets: test dataset of every client, in client order
+            device: device of the forward passes
+        """
+        self.device = device
+        inputs, labels = zip(*[dataset_tensors(data) for data in datasets])
+        sizes = torch.tensor([len(label) for label in labels])
+        self.offsets = torch.cat([torch.zeros(1, dtype=torch.long), sizes.cumsum(0)])
+        self.inputs = torch.cat(inputs)
+        self.labels = torch.cat(labels).long()
+        self.owners = torch.repeat_interleave(torch.arange(len(datasets)), sizes)
+
+    @torch.no_grad()
+    def evaluate(self, model, client_idxs=None):
+        """
+        average loss and accuracy of `model` on the test set of each client
+        ---
+        Args
+            client_idxs: clients to evaluate (default: all), in the order of the results
+        Return
+            {'loss': [...], 'acc': [...]}
+        """
+        if client_idxs is None:
+            client_idxs = range(len(self.offsets) - 1)
+        client_idxs = torch.as_tensor(list(client_idxs), dtype=torch.long)
+        # samples of the evaluated clients, owned by their position in `client_idxs`
+        starts, ends = self.offsets[client_idxs], self.offsets[client_idxs + 1]
+        sizes = ends - starts
+        samples = torch.repeat_interleave(starts - torch.cat([torch.zeros(1, dtype=torch.long), sizes.cumsum(0)[:-1]]),
+                                          sizes) + torch.arange(int(sizes.sum()))
+        owners = torch.repeat_interleave(torch.arange(len(client_idxs)), sizes)
+
+        model = model.to(self.device)
+        model.eval()
+        loss_sum = torch.zeros(len(client_idxs), dtype=torch.float64, device=self.device)
+        correct = torch.zeros(len(client_idxs), dtype=torch.long, device=self.device)
+        for start in range(0, len(samples), self.BATCH_SIZE):
+            batch = samples[start: start + self.BATCH_SIZE]
+            owner = owners[start: start + self.BATCH_SIZE].to(self.device)
+            input, labels = self.inputs[batch].to(self.device), self.labels[batch].to(self.device)
+            output = model(input)
+            loss_sum.index_add_(0, owner, F.cross_entropy(output, labels, reduction='none').double())
+            correct.index_add_(0, owner, (output.argmax(1) == labels).long())
+
+        sizes = sizes.double()
+        return {'loss': (loss_sum.cpu() / sizes).tolist(), 'acc': (correct.cpu() / sizes).tolist()}
@@ -0,0 +1,183 @@
+'''
+Process-based local training engine.
+
+Long-lived worker processes hold every client's training data in shared
+memory and a replica of the model. Once per round the server writes the
+global model into a shared-memory flat buffer; workers copy it into their
+replica before each client, train, and send back only the trained flat
+buffer and the metrics, so CPU training is not serialized by the GIL.
+'''
+import queue
+import time
+import traceback
+import torch
+import torch.multiprocessing as mp
+from torch.utils.data import TensorDataset
+
+from .flat_model import FlatLayout
+from .trainer import Trainer
+
+
+def pack_client_data(data, client_indices):
+    """
+    concatenate the datasets of several clients into one pair of tensors
+    ---
+    Args
+        data: {client_idx: TensorDataset(x, y)}
+        client_indices: clients to pack, in order
+    Return
+        packed x, packed y, {client_idx: (start, end)}
+    """
+    tensors_x, tensors_y, ranges = [], [], {}
+    start = 0
+    for client_idx in client_indices:
+        x, y = data[client_idx].tensors
+        tensors_x.append(x)
+        tensors_y.append(y)
+        ranges[client_idx] = (start, start + len(y))
+        start += len(y)
+    return torch.cat(tensors_x), torch.cat(tensors_y), ranges
+
+
+def _worker_loop(rank, args, model, data_x, data_y, ranges, global_buffer, task_queue, result_queue):
+    torch.set_num_threads(1)
+
+    layout = FlatLayout(model)
+    trainer = Trainer(args)
+    trainer.model = model
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        position, (client_idx, lr_local, mu, shuffle_seed) = task
+        task_start = time.perf_counter()
+        try:
+            trainer.args.lr_local = lr_local
+            # stochastic layers draw from a per-task stream, whichever worker
+            # runs the task and whether or not the run was resumed
+            torch.manual_seed(shuffle_seed)
+
+            # every client starts from the global model of this round
+            layout.copy_to(global_buffer, trainer.model)
+            start, end = ranges[client_idx]
+            local_data = TensorDataset(data_x[start:end], data_y[start:end])
+            if args.num_epoch == 0:  # no SGD updates
+                result = trainer.train_E0(local_data)
+            else:
+                result = trainer.train(local_data, mu=mu, shuffle_seed=shuffle_seed)
+            flat_model = layout.flatten(trainer.model, device='cpu')
+        except Exception:
+            # the server is blocked on the result of this task: report the failure instead
+            result_queue.put((position, None, traceback.format_exc(), None))
+            continue
+        result_queue.put((position, flat_model, result, (task_start, time.perf_counter() - task_start)))
+
+
+class ProcessPoolTrainer:
+    # seconds between checks that the workers are still alive
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, args, init_model, client_list, num_workers):
+        """
+        pool of worker processes for local training
+        ---
+        Args
+            args: arguments for overall FL training (mp_timeout: seconds to
+                wait for the next finished client, None: no limit)
+            init_model: model whose architecture the workers replicate
+            client_list: all clients; their training data is moved to shared memory
+            num_workers: number of worker processes
+        """
+        self.timeout = args.mp_timeout
+        self.layout = FlatLayout(init_model)
+        self.global_buffer = self.layout.flatten(init_model, device='cpu').share_memory_()
+
+        # one shared block for all clients; clients keep views into it
+        client_indices = [client.client_idx for client in client_list]
+        train_data = {client.client_idx: client.labeled_data for client in client_list}
+        data_x, data_y, self.ranges = pack_client_data(train_data, client_indices)
+        data_x.share_memory_()
+        data_y.share_memory_()
+        for client in client_list:
+            start, end = self.ranges[client.client_idx]
+            client.labeled_data = TensorDataset(data_x[start:end], data_y[start:end])
+
+        # CUDA cannot be re-initialized in a forked child
+        ctx = mp.get_context('fork' if str(args.device) == 'cpu' else 'spawn')
+        self.task_queue = ctx.Queue()
+        self.result_queue = ctx.Queue()
+        replica = Trainer(args)
+        replica.set_model(init_model)
+        self.workers = []
+        for rank in range(num_workers):
+            worker = ctx.Process(target=_worker_loop,
+                args=(rank, args, replica.model.cpu(), data_x, data_y, self.ranges,
+                      self.global_buffer, self.task_queue, self.result_queue),
+                daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def train(self, global_model, tasks):
+        """
+        train clients on the worker processes
+        ---
+        Args
+            global_model: current global model, broadcast once
+            tasks: list of (client_idx, lr_local, mu, shuffle_seed)
+        Raise
+            RuntimeError if the training of a client raised in its worker,
+            or a worker process died; TimeoutError if no client finished
+            within the timeout
+        Return
+            [(trained flat model, result, (start, duration))] in the order of
+            `tasks` (a client may appear in several tasks); the start time is
+            a `time.perf_counter()` value of the worker
+        """
+        self._check_workers()
+        self.layout.flatten(global_model, out=self.global_buffer)
+        for position, task in enumerate(tasks):
+            self.task_queue.put((position, task))
+
+        results = [None] * len(tasks)
+        errors = []
+        for _ in range(len(tasks)):
+            position, flat_model, result, timing = self._next_result()
+            if flat_model is None:
+                errors.append(f"local training of client {tasks[position][0]} failed in a worker process:\n{result}")
+            results[position] = (flat_model, result, timing)
+        # all results are collected first, so the queues stay in sync for later rounds
+        if errors:
+            raise RuntimeError(errors[0])
+        return results
+
+    def _next_result(self):
+        """
+        next finished task; fails instead of blocking forever when a worker
+        died or nothing finished within the timeout
+        """
+        waited = 0.
+        while True:
+            try:
+                return self.result_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                waited += self.POLL_INTERVAL
+            self._check_workers()
+            if self.timeout is not None and waited >= self.timeout:
+                raise TimeoutError(f"no local training finished within {self.timeout} seconds")
+
+    def _check_workers(self):
+        dead = [rank for rank, worker in enumerate(self.workers) if not worker.is_alive()]
+        if dead:
+            raise RuntimeError(f"training worker processes {dead} exited with codes "
+                               f"{[self.workers[rank].exitcode for rank in dead]}")
+
+    def close(self):
+        for _ in self.workers:
+            self.task_queue.put(None)
+        for worker in self.workers:
+            # a worker killed while reading the task queue can leave the others unable to read it
+            worker.join(timeout=10 * self.POLL_INTERVAL)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        self.workers = []
@@ -0,0 +1,126 @@
+'''
+Per-phase round profiler.
+
+Every phase of a round (selection, local training of each client,
+aggregation, post-processing, evaluation, logging) is timed and written
+as one JSON line to the trace file next to the results file:
+
+    {"round": 3, "phase": "local_train", "client": 17, "start": 12.81,
+     "duration": 0.0423, "num_samples": 480, "rss": 1893740544,
+     "peak_rss": 1902387200}
+
+`start` is in seconds since the profiler was created; `rss` is the
+resident memory of the process at the end of the phase (Linux only),
+`peak_rss` the peak resident memory of the process since it started
+(cumulative over phases) and `peak_cuda_mem` the peak CUDA memory
+allocated during the phase, all in bytes. Durations of CUDA phases are
+measured after synchronizing the device.
+'''
+from contextlib import contextmanager
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import torch
+
+
+# bytes per unit of `ru_maxrss`
+MAXRSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def current_rss():
+    """
+    resident memory of the process in bytes, or None where /proc is missing
+    """
+    try:
+        with open('/proc/self/statm') as fp:
+            return int(fp.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+class RoundProfiler:
+    def __init__(self, trace_file=None, device='cpu'):
+        """
+        profiler writing phase records to a JSONL trace
+        ---
+        Args
+            trace_file: opened text file for the trace (None: profiling off)
+            device: training device, synchronized around CUDA phases
+        """
+        self.trace_file = trace_file
+        self.enabled = trace_file is not None
+        self.cuda = torch.cuda.is_available() and str(device).startswith('cuda')
+        self.device = device
+        self.origin = time.perf_counter()
+        self.round_idx = None
+        self.running = {}
+        self.lock = threading.Lock()
+
+    def _sync(self):
+        if self.cuda:
+            torch.cuda.synchronize(self.device)
+
+    def begin_round(self, round_idx):
+        """
+        records are tagged with this round until the next call
+        """
+        self.round_idx = round_idx
+
+    def begin(self, phase):
+        """
+        start timing a phase of the current round
+        """
+        if not self.enabled:
+            return
+        self._sync()
+        if self.cuda:
+            torch.cuda.reset_peak_memory_stats(self.device)
+        self.running[phase] = time.perf_counter()
+
+    def end(self, phase, **fields):
+        """
+        stop timing a phase started with `begin` and record it
+        ---
+        Args
+            phase: name given to `begin`
+            fields: extra fields of the record, e.g. num_samples
+        """
+        if not self.enabled:
+            return
+        self._sync()
+        start = self.running.pop(phase)
+        self.record(phase, start, time.perf_counter() - start, **fields)
+
+    @contextmanager
+    def phase(self, phase, **fields):
+        """
+        time the enclosed block; the yielded dict can be filled with extra fields
+        """
+        extra = dict(fields)
+        self.begin(phase)
+        yield extra
+        self.end(phase, **extra)
+
+    def record(self, phase, start, duration, **fields):
+        """
+        write one record of a phase timed by the caller; `start` is a
+        `time.perf_counter()` value. Safe to call from worker threads
+        (per-client training, background evaluation); `fields` may
+        override the round of the record
+        """
+        if not self.enabled:
+            return
+        record = {'round': self.round_idx, 'phase': phase, 'start': round(start - self.origin, 6),
+                  'duration': round(duration, 6)}
+        record.update(fields)
+        rss = current_rss()
+        if rss is not None:
+            record['rss'] = rss
+        record['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+        if self.cuda:
+            record['peak_cuda_mem'] = torch.cuda.max_memory_allocated(self.device)
+        with self.lock:
+            self.trace_file.write(json.dumps(record) + '\n')
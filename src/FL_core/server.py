@@ -4,13 +4,27 @@ from copy import deepcopy
 from tqdm import tqdm
 import numpy as np
 import sys
+import os
 import multiprocessing as mp
 import random
 import copy
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 from .client import Client
 from .client_selection.config import *
 from .trainer import Trainer
+from .flat_model import FlatLayout
+from .process_pool import ProcessPoolTrainer
+from .cohort_trainer import CohortTrainer
+from .model_pool import ModelPool
+from .profiler import RoundProfiler
+from .sketch import GradientSketch
+from .checkpoint import CheckpointWriter, get_rng_state, set_rng_state
+from .client_selection.metric_cache import MetricCache
+from .loss_probe import LossProbe
+from .packed_eval import PackedEvaluator
 from utils import logger
 
 from torch.utils.data import TensorDataset
@@ -44,12 +58,23 @@ class Server(object):
         self.device = args.device
         self.args = args
         self.global_model = init_model
+        # flat layouts of the whole state dict (aggregation) and of the
+        # parameters only (client selection), shared by all components
+        self.layout = fed_algo.layout
+        self.param_layout = FlatLayout(init_model, params_only=True)
         self.selection_method = selection
         self.selection_method.server = self
+        self.selection_method.param_layout = self.param_layout
+        if args.sketch_dim is not None:
+            # similarity-based selectors work on low-dimensional sketches of the deltas
+            self.selection_method.sketch = GradientSketch(self.param_layout, args.sketch_dim,
+                method=args.sketch_method, seed=args.seed, device=args.device)
         self.federated_method = fed_algo
         self.files = files
+        self.profiler = RoundProfiler(files.get('trace'), args.device)
 
         self.nCPU = mp.cpu_count() // 2 if args.nCPU is None else args.nCPU
+        self.process_pool = None
 
         self.total_num_client = args.total_num_client
         self.num_clients_per_round = args.num_clients_per_round
@@ -58,6 +83,11 @@ class Server(object):
             random.seed(args.seed)
 
         self.total_round = args.num_round
+        self.start_round = 0
+        self.checkpoint_writer = None
+        if args.checkpoint_freq > 0:
+            self.checkpoint_writer = CheckpointWriter(
+                os.path.join(args.save_path, f'checkpoint_{args.file_name_opt}.pt'))
         self.save_results = not args.no_save_results
         self.save_probs = args.save_probs
 
@@ -80,31 +110,109 @@ class Server(object):
         if self.args.method in LOSS_THRESHOLD:
             self.ltr = 0.0
 
+        # select on the forward-only losses of the candidates instead of training them all
+        self.loss_probe = None
+        if self.args.probe_loss:
+            if self.args.method in LOSS_PROBE_METHOD:
+                self.loss_probe = LossProbe(self.args)
+            else:
+                logger.warn(f"{self.args.method} does not select on local losses, no loss probing")
+
+        if self.args.capture_outputs and self.args.method not in CAPTURE_OUTPUTS_METHOD:
+            logger.warn(f"{self.args.method} does not use per-sample outputs, do not capture them")
+            self.args.capture_outputs = False
+
+        # reuse the metrics of post-selection methods for a few rounds
+        self.metric_cache = None
+        if self.args.metric_staleness is not None:
+            if self.args.method in PRE_SELECTION_METHOD or self.loss_probe is not None:
+                logger.warn(f"{self.args.method} selects before training, no metrics to cache")
+            else:
+                self.metric_cache = MetricCache(self.total_num_client, self.args.metric_staleness)
+                if self.args.method == 'DivFL' and self.args.sketch_dim is None:
+                    # the cache holds one model delta per client
+                    size = self.total_num_client * self.param_layout.numel * 4 / 2 ** 20
+                    logger.warn(f"{self.args.method} caches the full model delta of every client ({size:.0f} MB), "
+                                "use --sketch_dim to cache sketches instead")
+
+        if self.args.use_mp and self.args.mp_backend == 'process' and self.args.method in NEED_LOCAL_GRADS_METHOD:
+            logger.warn(f"{self.args.method} reads the gradients of the local models, "
+                        "which worker processes do not send back: train clients on threads")
+            self.args.mp_backend = 'thread'
+
+        # vectorized training of small models, several clients at a time
+        self.cohort_trainer = None
+        if self.args.cohort_size is not None:
+            if CohortTrainer.supports(init_model, self.args) and self.args.method not in ["FedCorr"] + LOSS_THRESHOLD:
+                self.cohort_trainer = CohortTrainer(self.args, init_model)
+            else:
+                logger.warn(f"Cohort training does not support {self.args.method} with this model/optimizer, "
+                            "train clients one by one")
+
         self.global_trainer = Trainer(self.args)
-        all_data_by_label = {}
-        for client_id, local_data in self.test_data.items():
-            batch_x, batch_y = local_data.tensors
-            for x, y in zip(batch_x, batch_y):
-                label = int(y)
-                if label not in all_data_by_label:
-                    all_data_by_label[label] = [[], []]
-                all_data_by_label[label][0].append(x)
-                all_data_by_label[label][1].append(y)
-        min_sample = min([len(data_pair[1]) for data_pair in all_data_by_label.values()])
-        xss = []
-        yss = []
-        for label, data_pair in all_data_by_label.items():
-            xs, ys = data_pair
-            selected_data_idx = np.random.choice(
-                len(ys), min_sample, replace=False)
-            xss.append(torch.stack(xs)[selected_data_idx])
-            yss.append(torch.stack(ys)[selected_data_idx])
-
-        X = torch.cat(xss, dim=0)
-        Y = torch.cat(yss, dim=0)
-        perm = torch.randperm(len(Y))
-        self.global_test_data = TensorDataset(X[perm], Y[perm])
-        logger.info(f"Global test data size: {len(Y)}")
+        self.packed_evaluator = None
+        # pipelined rounds: evaluate round t in the background during round t+1,
+        # unless the selection method consumes the result in the next round
+        self.eval_executor, self.pending_eval = None, None
+        if self.args.pipeline_eval and self.args.method not in NEED_GLOBAL_TEST_METHOD:
+            self.eval_model = deepcopy(init_model)
+            self.eval_executor = ThreadPoolExecutor(max_workers=1)
+        self.global_test_data = self._build_global_test_data()
+        logger.info(f"Global test data size: {len(self.global_test_data)}")
+
+    def _test_data_fingerprint(self):
+        """
+        short digest of the test data of every client
+        """
+        digest = hashlib.sha1()
+        for client_idx in sorted(self.test_data):
+            local_data = self.test_data[client_idx]
+            digest.update(f"{client_idx}:{len(local_data)};".encode())
+            for tensor in local_data.tensors[:2]:
+                digest.update(tensor.contiguous().numpy())
+        return digest.hexdigest()[:16]
+
+    def _build_global_test_data(self):
+        """
+        class-balanced global test set: the same number of samples of every
+        label, drawn from all clients' test data. It is drawn with its own
+        RNG streams (so it does not depend on, nor shift, the global ones)
+        and cached on disk keyed by dataset, seed and a fingerprint of the
+        clients' test data, which changes with the partition.
+        """
+        cache_path = os.path.join(self.args.data_dir,
+            f"{self.args.dataset}_global_test_seed{self.args.seed}_{self._test_data_fingerprint()}.pt")
+        if os.path.exists(cache_path):
+            X, Y = torch.load(cache_path)
+            logger.info(f"Load cached global test data from {cache_path}")
+            return TensorDataset(X, Y)
+
+        datasets = [local_data for local_data in self.test_data.values() if len(local_data) > 0]
+        Y = torch.cat([local_data.tensors[1] for local_data in datasets])
+        labels = Y.long().numpy()
+        _, label_idx, counts = np.unique(labels, return_inverse=True, return_counts=True)
+        min_sample = counts.min()
+
+        # shuffle within each label with random sort keys and keep the first
+        # `min_sample` samples of every label
+        rng = np.random.RandomState(self.args.seed)
+        order = np.lexsort((rng.random_sample(len(labels)), label_idx))
+        label_start = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        rank_in_label = np.arange(len(labels)) - label_start[label_idx[order]]
+        selected_data_idx = torch.from_numpy(order[rank_in_label < min_sample])
+
+        generator = torch.Generator()
+        generator.manual_seed(self.args.seed)
+        selected_data_idx = selected_data_idx[torch.randperm(len(selected_data_idx), generator=generator)]
+        X = torch.cat([local_data.tensors[0] for local_data in datasets])[selected_data_idx]
+        Y = Y[selected_data_idx]
+
+        try:
+            torch.save((X, Y), cache_path + '.tmp')
+            os.replace(cache_path + '.tmp', cache_path)
+        except OSError as e:
+            logger.warn(f"Fail to cache global test data at {cache_path}: {e}")
+        return TensorDataset(X, Y)
    
     def _init_clients(self, init_model):
         """
@@ -113,28 +221,82 @@ class Server(object):
         Args
             init_model: initial given global model
         """
+        # reusable local model instances instead of one deepcopy per client and round
+        self.model_pool = None
+        pool_size = self.default_model_pool_size() if self.args.model_pool_size is None else self.args.model_pool_size
+        if pool_size > 0:
+            self.model_pool = ModelPool(init_model, self.layout, pool_size)
+
         self.client_list = []
         for client_idx in range(self.total_num_client):
             local_train_data = self.train_data[client_idx]
             local_test_data = self.test_data[client_idx] if client_idx in self.test_clients else np.array([])
             c = Client(client_idx, self.train_sizes[client_idx], local_train_data,
-                local_test_data, self.args)
+                local_test_data, self.args, model_pool=self.model_pool)
             self.client_list.append(c)
 
+    def default_model_pool_size(self):
+        """
+        number of local models alive at the same time in a round
+        """
+        if self.args.method in CANDIDATE_SELECTION_METHOD:
+            return self.args.num_candidates
+        elif self.args.method in PRE_SELECTION_METHOD:
+            return self.num_clients_per_round
+        else:
+            return self.total_num_client if self.num_available is None else self.num_available
+
     def global_test(self):
         if self.global_trainer is None:
             return
         result = self.global_trainer.test(self.global_model, self.global_test_data)
         return result
 
+    def snapshot_test(self, round_idx, snapshot):
+        """
+        test a flat snapshot of the global model on the global test data
+        """
+        start = time.perf_counter()
+        self.layout.copy_to(snapshot, self.eval_model)
+        self.eval_model.eval()
+        result = self.global_trainer.test(self.eval_model, self.global_test_data)
+        self.profiler.record('background_eval', start, time.perf_counter() - start,
+                             round=round_idx, num_samples=len(self.global_test_data))
+        return result
+
+    def wait_global_test(self):
+        """
+        wait for the pending background evaluation and record its result
+        """
+        if self.pending_eval is None:
+            return
+        round_idx, record, future = self.pending_eval
+        self.pending_eval = None
+        self.record_global_test(round_idx, record, future.result())
+
+    def record_global_test(self, round_idx, record, result):
+        phase='Test'
+        record[f'{phase}/Loss'] = result["loss"]
+        record[f'{phase}/Acc'] = result["acc"]
+
+        ##################################################################
+        #                        Record log info 
+        ##################################################################  
+        logger.info('[ROUND {}] {}ing: Loss {:.6f} Acc {:.4f}'.format(round_idx, phase, result["loss"], result["acc"]))
+
+        if self.args.wandb:
+            wandb.log(record)
+
     def train(self):
         """
         FL training
         """
         ## ITER COMMUNICATION ROUND
-        for round_idx in range(self.total_round):
+        for round_idx in range(self.start_round, self.total_round):
             print()
             logger.info(f'ROUND {round_idx}')
+            self.profiler.begin_round(round_idx)
+            self.profiler.begin('selection')
 
             ## GET GLOBAL MODEL
             #self.global_model = self.trainer.get_model()
@@ -195,42 +357,75 @@ class Server(object):
                     client_indices = self.selection_method.select(self.num_clients_per_round, client_indices, None)
                     logger.info(f'Pre-client selection {num_before} -> {len(client_indices)}')
                 print_selected_client(client_indices)
+            elif self.loss_probe is not None:
+                # score the candidates by the loss of the global model, then train the selected only
+                num_before = len(client_indices)
+                probed_metrics = self.loss_probe.probe(
+                    self.global_model, [self.client_list[idx] for idx in client_indices], round_idx)
+                selected_client_indices = self.selection_method.select(
+                    self.num_clients_per_round, client_indices, probed_metrics, round=round_idx)
+                client_indices = np.take(client_indices, selected_client_indices).tolist()
+                logger.info(f'Probed client selection {num_before} -> {len(client_indices)}')
+                print_selected_client(client_indices)
+            self.profiler.end('selection', num_clients=len(client_indices))
 
             ##################################################################
             #                        CLIENT UPDATE (TRAINING)
             ##################################################################
             engaged_client_indices = deepcopy(client_indices)
+            # with the clients to aggregate known before training, fold every
+            # local model into the aggregate as soon as it is trained
+            streamed = self.can_stream_aggregation(client_indices)
+            if streamed:
+                self.federated_method.begin_round(client_indices)
+            # with cached metrics, only the candidates whose metric is missing or stale are trained
+            if self.metric_cache is not None:
+                engaged_client_indices = self.metric_cache.stale(client_indices, round_idx)
+                logger.info(f'Stale metrics {len(engaged_client_indices)}/{len(client_indices)}')
             ### TODO huhanpeng: add a L2(M_local-M_global) to the loss function
-            local_losses, accuracy, local_metrics = self.train_clients(client_indices)
+            local_losses, accuracy, local_metrics = self.train_clients(
+                engaged_client_indices, on_trained=self.fold_client_update if streamed else None)
 
             ##################################################################
             #                        POST-CLIENT SELECTION
             ##################################################################
-            if self.args.method not in PRE_SELECTION_METHOD:
+            if self.args.method not in PRE_SELECTION_METHOD and self.loss_probe is None:
+                self.profiler.begin('post_selection')
                 logger.info(f'Post-client selection {self.num_clients_per_round}/{len(client_indices)}')
                 kwargs = {'n': self.num_clients_per_round, 'client_idxs': client_indices, 'round': round_idx}
                 kwargs['results'] = self.files['prob'] if self.save_probs else None
-                # select by local models(gradients)
-                if self.args.method in NEED_LOCAL_MODELS_METHOD:
-                    local_models = [self.client_list[idx].trainer.get_model() for idx in client_indices]
-                    selected_client_indices = self.selection_method.select(**kwargs, metric=local_models)
+                # select by local models(gradients), or by local losses otherwise
+                # with cached metrics, possibly no candidate was trained
+                if self.args.method in NEED_LOCAL_MODELS_METHOD and len(engaged_client_indices) > 0:
+                    local_models = [self.client_list[idx].trainer.get_model() for idx in engaged_client_indices]
+                    local_metrics = self.selection_method.local_model_metric(local_models)
                     del local_models
-                # select by local losses
-                else:
-                    selected_client_indices = self.selection_method.select(**kwargs, metric=local_metrics)
+                if self.metric_cache is not None:
+                    self.metric_cache.update(engaged_client_indices, local_metrics, local_losses, round_idx)
+                    local_metrics = self.metric_cache.get(client_indices)
+                    trained = dict(zip(engaged_client_indices, zip(local_losses, accuracy)))
+                selected_client_indices = self.selection_method.select(**kwargs, metric=local_metrics)
                 if self.args.method in CLIENT_UPDATE_METHOD:
                     for idx in client_indices:
                         self.client_list[idx].update_ema_variables(round_idx)
                 # update local metrics
                 client_indices = np.take(client_indices, selected_client_indices).tolist()
                 print_selected_client(client_indices)
-                local_losses = np.take(local_losses, selected_client_indices)
-                accuracy = np.take(accuracy, selected_client_indices)
+                if self.metric_cache is not None:
+                    # the clients selected on cached metrics are trained now
+                    self.train_cached_selection(client_indices, engaged_client_indices, trained, round_idx)
+                    local_losses = np.array([trained[idx][0] for idx in client_indices])
+                    accuracy = np.array([trained[idx][1] for idx in client_indices])
+                else:
+                    local_losses = np.take(local_losses, selected_client_indices)
+                    accuracy = np.take(accuracy, selected_client_indices)
+                self.profiler.end('post_selection', num_clients=len(client_indices))
 
             ## CHECK and SAVE current updates
             # self.weight_variance(local_models) # check variance of client weights
-            self.save_current_updates(local_losses, accuracy, len(client_indices), phase='Train', round=round_idx)
-            self.save_selected_clients(round_idx, client_indices)
+            with self.profiler.phase('logging'):
+                self.save_current_updates(local_losses, accuracy, len(client_indices), phase='Train', round=round_idx)
+                self.save_selected_clients(round_idx, client_indices)
             # DEBUGGING
             if self.args.method not in ["PBFL", "FedCorr", "Cosin"]:
                 assert len(client_indices) == self.num_clients_per_round, \
@@ -239,16 +434,19 @@ class Server(object):
             ##################################################################
             #                        SERVER AGGREGATION
             ##################################################################
-            self.aggregate_model(client_indices)
+            with self.profiler.phase('aggregation', num_clients=len(client_indices)):
+                self.aggregate_model(client_indices, streamed=streamed)
             
             ##################################################################
             #                        POST-process for each selection method
             ##################################################################
-            self.selection_method.post_process(engaged_client_indices)
+            with self.profiler.phase('post_process'):
+                self.selection_method.post_process(engaged_client_indices)
             
             ##################################################################
             #                        TEST
             ##################################################################  
+            self.profiler.begin('evaluation')
             self.global_model.eval()
             if self.test_on_training_data:
                 # test on train dataset
@@ -256,46 +454,158 @@ class Server(object):
                 self.test(self.total_num_client, phase='TrainALL')
                 self.test_on_training_data = False
             # test on test dataset
-            result = self.global_test()
-            local_models = [self.client_list[idx].trainer.get_model() for idx in client_indices]
-            if self.args.method in ["PBFL", 'Cosin']:
-                self.selection_method.global_loss = result["loss"]
-                self.selection_method.global_accu = result["acc"]
-                self.selection_method.post_update(client_indices, local_models, self.global_model)
-            # self.test(len(self.test_clients), phase='Test')
-            phase='Test'
-            self.record[f'{phase}/Loss'] = result["loss"]
-            self.record[f'{phase}/Acc'] = result["acc"]
-
-            ##################################################################
-            #                        Record log info 
-            ##################################################################  
-            logger.info('[ROUND {}] {}ing: Loss {:.6f} Acc {:.4f}'.format(round_idx, phase, result["loss"], result["acc"]))
-
-            if self.args.wandb:
-                wandb.log(self.record)
+            if self.eval_executor is not None:
+                # evaluate a snapshot in the background, overlapped with the next round
+                self.wait_global_test()
+                snapshot = self.layout.flatten(self.global_model, device='cpu')
+                self.pending_eval = (round_idx, self.record,
+                                     self.eval_executor.submit(self.snapshot_test, round_idx, snapshot))
+            else:
+                result = self.global_test()
+                if self.args.method in POST_UPDATE_METHOD:
+                    local_models = [self.client_list[idx].trainer.get_model() for idx in client_indices]
+                    self.selection_method.global_loss = result["loss"]
+                    self.selection_method.global_accu = result["acc"]
+                    self.selection_method.post_update(client_indices, local_models, self.global_model)
+                    del local_models
+                # self.test(len(self.test_clients), phase='Test')
+                self.record_global_test(round_idx, self.record, result)
+            self.profiler.end('evaluation', background=self.eval_executor is not None)
 
             ## Clear garbages
-            del local_models, local_losses, accuracy
+            del local_losses, accuracy
             for client_idx in engaged_client_indices:
                 self.client_list[client_idx].trainer.clear_model()
 
+            if self.checkpoint_writer is not None and \
+                    ((round_idx + 1) % self.args.checkpoint_freq == 0 or round_idx + 1 == self.total_round):
+                with self.profiler.phase('checkpoint'):
+                    self.save_checkpoint(round_idx + 1)
+
+        if self.eval_executor is not None:
+            self.wait_global_test()
+            self.eval_executor.shutdown()
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
+        if self.process_pool is not None:
+            self.process_pool.close()
         for k in self.files:
             if self.files[k] is not None:
                 self.files[k].close()
 
-    def aggregate_model(self, selected_client_idxs):
+    def state_dict(self, next_round):
+        """
+        snapshot of everything a resumed run needs to continue bit-identically
+        ---
+        Args
+            next_round: first round the resumed run will execute
+        """
+        state = {
+            'round': next_round,
+            'method': self.args.method,
+            'seed': self.args.seed,
+            'global_model': {k: v.detach().cpu().clone() for k, v in self.global_model.state_dict().items()},
+            'fed_algo': self.federated_method.state_dict(),
+            'selection': self.selection_method.state_dict(),
+            'lr_local': self.args.lr_local,
+            'num_trainings': [client.num_trainings for client in self.client_list],
+            'rng': get_rng_state(),
+        }
+        if self.args.method in LOSS_THRESHOLD:
+            state['ltr'] = self.ltr
+        if self.metric_cache is not None:
+            state['metric_cache'] = self.metric_cache.state_dict()
+        return state
+
+    def load_state_dict(self, state):
+        assert (state['method'], state['seed']) == (self.args.method, self.args.seed), \
+            f"checkpoint of {state['method']} (seed {state['seed']}) cannot resume {self.args.method} (seed {self.args.seed})"
+        self.start_round = state['round']
+        self.global_model.load_state_dict(state['global_model'])
+        self.federated_method.load_state_dict(state['fed_algo'])
+        self.selection_method.load_state_dict(state['selection'])
+        self.args.lr_local = state['lr_local']
+        for client, num_trainings in zip(self.client_list, state['num_trainings']):
+            client.num_trainings = num_trainings
+        if 'ltr' in state:
+            self.ltr = state['ltr']
+        if self.metric_cache is not None:
+            self.metric_cache.load_state_dict(state['metric_cache'])
+        set_rng_state(state['rng'])
+
+    def save_checkpoint(self, next_round):
+        """
+        checkpoint the server state at the end of a round; the state is
+        snapshotted here and written to disk in the background
+        """
+        # the record of the round must reach the logs before the checkpoint
+        self.wait_global_test()
+        for k in self.files:
+            if self.files[k] is not None:
+                self.files[k].flush()
+        self.checkpoint_writer.write(self.state_dict(next_round))
+        logger.info(f'Checkpoint before round {next_round} to {self.checkpoint_writer.path}')
+
+    def load_checkpoint(self, path):
+        state = torch.load(path, map_location='cpu', weights_only=False)
+        self.load_state_dict(state)
+        logger.info(f'Resume from {path} at round {self.start_round}')
+
+    def train_cached_selection(self, client_indices, engaged_client_indices, trained, round_idx):
+        """
+        train the selected clients that were selected on cached metrics, and
+        refresh their metrics in the cache
+        ---
+        Args
+            client_indices: selected clients
+            engaged_client_indices: clients trained in this round, extended in place
+            trained: {client: (loss, acc)} of this round, updated in place
+        """
+        missing = [idx for idx in client_indices if idx not in trained]
+        if len(missing) == 0:
+            return
+        local_losses, accuracy, local_metrics = self.train_clients(missing)
+        if self.args.method in NEED_LOCAL_MODELS_METHOD:
+            local_models = [self.client_list[idx].trainer.get_model() for idx in missing]
+            local_metrics = self.selection_method.local_model_metric(local_models)
+            del local_models
+        self.metric_cache.update(missing, local_metrics, local_losses, round_idx)
+        trained.update(zip(missing, zip(local_losses, accuracy)))
+        engaged_client_indices.extend(missing)
+
+    def can_stream_aggregation(self, client_indices):
+        """
+        local models can be aggregated (and freed) as soon as they are trained
+        when the clients are selected before training and nobody needs the
+        local models after aggregation; a client selected several times
+        (sampling with replacement) shares one local model, so such rounds
+        are aggregated after training
+        """
+        return (self.args.method in PRE_SELECTION_METHOD or self.loss_probe is not None) \
+            and self.args.method not in POST_UPDATE_METHOD \
+            and len(set(client_indices)) == len(client_indices)
+
+    def fold_client_update(self, client_idx):
+        """
+        fold the freshly trained model of a client into the aggregate and free it
+        """
+        trainer = self.client_list[client_idx].trainer
+        self.federated_method.add_client_update(client_idx, trainer.get_model())
+        trainer.clear_model()
+
+    def aggregate_model(self, selected_client_idxs, streamed=False):
         # aggregate local models
-        local_models = [self.client_list[idx].trainer.get_model() for idx in selected_client_idxs]
-        if self.args.fed_algo == 'FedAvg':
-            global_model_params = self.federated_method.update(local_models, selected_client_idxs)
+        if streamed:
+            # local models were folded in by `fold_client_update`
+            global_model_params = self.federated_method.finalize(self.global_model)
         else:
+            local_models = [self.client_list[idx].trainer.get_model() for idx in selected_client_idxs]
             global_model_params = self.federated_method.update(
-                local_models, selected_client_idxs, self.global_model, self.client_list)
+                local_models, selected_client_idxs, self.global_model)
+            del local_models
         
         # update aggregated model to global model
         self.global_model.load_state_dict(global_model_params)
-        del local_models
             
     def local_training(self, client_idx):
         """
@@ -306,6 +616,7 @@ class Server(object):
         Return
             result: trained model, (total) loss value, accuracy
         """
+        start = time.perf_counter()
         client = self.client_list[client_idx]
         if self.args.method in LOSS_THRESHOLD:
             client.trainer.update_ltr(self.ltr)
@@ -315,6 +626,8 @@ class Server(object):
             result = client.train(self.global_model, mu=mu)
         else:
             result = client.train(self.global_model)
+        self.profiler.record('local_train', start, time.perf_counter() - start,
+                             client=int(client_idx), num_samples=result['num_samples'])
         return result
 
     def local_testing(self, client_idx, use_local_model=False):
@@ -330,29 +643,61 @@ class Server(object):
                             use_local_model=use_local_model)
         return result
 
-    def train_clients(self, client_indices):
+    def train_clients(self, client_indices, on_trained=None):
         """
         train multiple clients (w. or w.o. multi processing) with 
         the global model
         ---
         Args
             client_indices: client indices for training
+            on_trained: optional callback(client_idx), called in order as
+                soon as each client has finished training
         Return
             trained models, loss values, accuracies
         """
-        local_losses, accuracy, local_metrics = [], [], []
+        self.profiler.begin('local_training')
+        if self.model_pool is not None:
+            # broadcast the global model to the pooled local models
+            self.model_pool.refresh(self.global_model)
+
+        local_losses, accuracy, local_metrics, num_samples = [], [], [], []
         ll, lh = np.inf, 0.
-        # local training with multi processing
-        if self.args.use_mp:
+        # local training on worker processes
+        if self.args.use_mp and self.args.mp_backend == 'process':
+            assert self.args.method not in LOSS_THRESHOLD, "loss thresholds need in-process trainers"
+            for client_idx, result in zip(client_indices, self.process_training(client_indices)):
+                local_losses.append(result['loss'])
+                accuracy.append(result['acc'])
+                local_metrics.append(result['metric'])
+                num_samples.append(result['num_samples'])
+                if on_trained is not None:
+                    on_trained(client_idx)
+        # vectorized local training of cohorts of clients
+        elif self.cohort_trainer is not None:
+            for client_idx, result in zip(client_indices, self.cohort_training(client_indices)):
+                local_losses.append(result['loss'])
+                accuracy.append(result['acc'])
+                local_metrics.append(result['metric'])
+                num_samples.append(result['num_samples'])
+                if on_trained is not None:
+                    on_trained(client_idx)
+        # local training with multi processing (a client selected several times
+        # has one trainer, so its trainings cannot run concurrently)
+        elif self.args.use_mp and len(client_indices) > 0 and len(set(client_indices)) == len(client_indices):
             iter = 0
             with mp.pool.ThreadPool(processes=self.nCPU) as pool:
                 iter += 1
-                result = list(pool.imap(self.local_training, client_indices))
+                result = []
+                for client_idx, client_result in zip(client_indices, pool.imap(self.local_training, client_indices)):
+                    result.append(client_result)
+                    if on_trained is not None:
+                        on_trained(client_idx)
 
                 result = {k: [result[idx][k] for idx in range(len(result))] for k in result[0].keys()}
                 local_losses.extend(result['loss'])
                 accuracy.extend(result['acc'])
                 local_metrics.extend(result['metric'])
+                num_samples.extend(result['num_samples'])
 
                 # progressBar(len(local_losses), len(client_indices),
                 #             {'loss': sum(result['loss'])/len(result), 'acc': sum(result['acc'])/len(result)})
@@ -368,6 +713,9 @@ class Server(object):
                 local_losses.append(result['loss'])
                 accuracy.append(result['acc'])
                 local_metrics.append(result['metric'])
+                num_samples.append(result['num_samples'])
+                if on_trained is not None:
+                    on_trained(client_idx)
 
                 if self.args.method in LOSS_THRESHOLD:
                     if result['llow'] < ll: ll = result['llow'].item()
@@ -379,8 +727,60 @@ class Server(object):
             lh /= len(client_indices)
             self.ltr = self.selection_method.update(lh, ll, self.ltr)
 
+        self.profiler.end('local_training', num_clients=len(client_indices), num_samples=int(sum(num_samples)))
         return local_losses, accuracy, local_metrics
 
+    def process_training(self, client_indices):
+        """
+        train multiple clients on the process pool; each trained model
+        is loaded back into the client's trainer
+        ---
+        Args
+            client_indices: client indices for training
+        Return
+            training results in the order of `client_indices`
+        """
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolTrainer(self.args, self.global_model, self.client_list, self.nCPU)
+
+        tasks = []
+        for client_idx in client_indices:
+            mu = self.selection_method.get_mu(client_idx) if self.args.method == "FedCorr" else 0
+            tasks.append((client_idx, self.args.lr_local, mu, self.client_list[client_idx].next_shuffle_seed()))
+        trained = self.process_pool.train(self.global_model, tasks)
+
+        results = []
+        # in order, so a client trained twice keeps its last model, as in-process
+        for client_idx, (flat_model, result, (start, duration)) in zip(client_indices, trained):
+            self.profiler.record('local_train', start, duration,
+                                 client=int(client_idx), num_samples=result['num_samples'])
+            client = self.client_list[client_idx]
+            client.trainer.set_model(self.global_model)
+            self.layout.copy_to(flat_model, client.trainer.model.cpu())
+            results.append(client.scale_metric(result))
+        return results
+
+    def cohort_training(self, client_indices):
+        """
+        train multiple clients in cohorts of `args.cohort_size` with
+        the vectorized cohort trainer
+        ---
+        Args
+            client_indices: client indices for training
+        Return
+            training results in the order of `client_indices`
+        """
+        results = []
+        for start in range(0, len(client_indices), self.args.cohort_size):
+            cohort = [self.client_list[idx] for idx in client_indices[start: start + self.args.cohort_size]]
+            cohort_start = time.perf_counter()
+            cohort_results = self.cohort_trainer.train(self.global_model, cohort)
+            self.profiler.record('cohort_train', cohort_start, time.perf_counter() - cohort_start,
+                                 clients=[client.client_idx for client in cohort],
+                                 num_samples=sum(result['num_samples'] for result in cohort_results))
+            results.extend(cohort_results)
+        return results
+
     def test(self, num_clients_for_test, phase='Test', save=True, 
              use_local_model=False):
         """
@@ -404,7 +804,13 @@ class Server(object):
             clients_to_test = list(num_clients_for_test)
         
         metrics = {'loss': [], 'acc': []}
-        if self.args.use_mp:
+        if not (use_local_model or self.test_on_training_data):
+            # all clients' test sets, packed once, in a few large forward passes
+            if self.packed_evaluator is None:
+                self.packed_evaluator = PackedEvaluator(
+                    [self.client_list[idx].test_data for idx in range(self.total_num_client)], self.device)
+            metrics = self.packed_evaluator.evaluate(self.global_model, clients_to_test)
+        elif self.args.use_mp:
             iter = 0
             with mp.pool.ThreadPool(processes=self.nCPU) as pool:
                 iter += 1
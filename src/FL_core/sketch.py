@@ -0,0 +1,138 @@
+'''
+Low-dimensional sketches of flattened model deltas.
+
+Similarity-based selectors only need norms, inner products and distances
+of clients' model deltas. A seeded linear sketch S maps a delta of
+`layout.numel` floats to `sketch_dim` floats with E[<Sx, Sy>] = <x, y>,
+so these quantities can be computed (approximately) on the sketch at a
+fraction of the memory and compute.
+
+The sketch is blocked by layer: every tensor of the layout gets its own
+block of sketch coordinates, sized in proportion to its number of
+elements (small tensors are kept exactly), so per-layer quantities are
+available on the sketch through `segments()`.
+
+Two sketches are provided:
+    'jl': dense Gaussian Johnson-Lindenstrauss projection. The projection
+        is regenerated from the seed, chunk by chunk, at every call instead
+        of being stored, so it costs sketch_dim x numel flops per call;
+        sketch many rows at once.
+    'count': count-sketch; every coordinate is added with a random sign
+        to one random coordinate of its block. Linear time, and the only
+        state is one bucket and one sign per coordinate.
+'''
+import torch
+
+from utils import logger
+
+
+class GradientSketch:
+    def __init__(self, layout, sketch_dim, method='count', seed=0, device='cpu'):
+        """
+        seeded layer-blocked sketch of flat buffers with a given layout
+        ---
+        Args
+            layout: FlatLayout of the sketched buffers
+            sketch_dim: (approximate) total number of sketch coordinates
+            method: 'jl' or 'count'
+            seed: seed of the random projection
+            device: device of the sketches
+        """
+        assert method in ('jl', 'count'), method
+        self.layout = layout
+        self.method = method
+        self.seed = seed
+        self.device = device
+
+        # sketch coordinates of every tensor: proportional to its size,
+        # at least one, and no more than the tensor itself (then kept exactly)
+        self.dims = [min(numel, max(1, round(sketch_dim * numel / layout.numel))) for numel in layout.numels]
+        self.offsets = [sum(self.dims[:l]) for l in range(len(self.dims))]
+        self.sketch_dim = sum(self.dims)
+
+        if method == 'count':
+            generator = torch.Generator()
+            generator.manual_seed(seed)
+            buckets, signs = [], []
+            for offset, dim, numel in zip(self.offsets, self.dims, layout.numels):
+                if dim == numel:
+                    buckets.append(torch.arange(numel) + offset)
+                    signs.append(torch.ones(numel))
+                else:
+                    buckets.append(torch.randint(dim, (numel,), generator=generator) + offset)
+                    signs.append(torch.randint(2, (numel,), generator=generator) * 2. - 1.)
+            self.buckets = torch.cat(buckets).to(device)
+            self.signs = torch.cat(signs).to(device)
+        self.reported = False
+
+    def __len__(self):
+        return self.sketch_dim
+
+    def segments(self):
+        """
+        (offset, numel) of the block of each tensor in the sketch
+        """
+        return zip(self.offsets, self.dims)
+
+    # rows of a JL projection generated at once, to bound its memory
+    JL_CHUNK = 1 << 14
+
+    def _project(self, l, block, out):
+        # out = block @ R with R (numel x dim) ~ N(0, 1/dim), regenerated
+        # from the seed chunk by chunk rather than stored
+        generator = torch.Generator(device=out.device)
+        generator.manual_seed(self.seed * 100003 + l)
+        dim = out.shape[1]
+        out.zero_()
+        for start in range(0, block.shape[1], self.JL_CHUNK):
+            chunk = block[:, start: start + self.JL_CHUNK]
+            R = torch.randn((chunk.shape[1], dim), generator=generator, device=out.device, dtype=out.dtype)
+            out.addmm_(chunk, R.div_(dim ** 0.5))
+
+    @torch.no_grad()
+    def sketch(self, flats):
+        """
+        sketch one flat buffer or a (rows x numel) matrix of flat buffers
+        ---
+        Return
+            (sketch_dim,) or (rows x sketch_dim) tensor on `self.device`
+        """
+        single = flats.dim() == 1
+        flats = flats.to(self.device).reshape(-1, self.layout.numel)
+        out = torch.zeros((flats.shape[0], self.sketch_dim), dtype=flats.dtype, device=self.device)
+        if self.method == 'count':
+            out.index_add_(1, self.buckets, flats * self.signs)
+        else:
+            for l, ((src, numel), (dst, dim)) in enumerate(zip(self.layout.segments(), self.segments())):
+                block = flats[:, src: src + numel]
+                if dim == numel:
+                    out[:, dst: dst + dim] = block
+                else:
+                    self._project(l, block, out[:, dst: dst + dim])
+        return out[0] if single else out
+
+    def relative_error(self, flats, sketches):
+        """
+        worst relative error of the squared norms and of the pairwise squared
+        distances of some rows, measured on the sketch against the exact values
+        """
+        flats = flats.to(self.device).double()
+        sketches = sketches.to(self.device).double()
+        exact, approx = flats.pow(2).sum(1), sketches.pow(2).sum(1)
+        error = {'norm': ((approx - exact).abs() / exact.clamp(min=1e-30)).max().item()}
+        if len(flats) > 1:
+            exact, approx = torch.cdist(flats, flats).pow(2), torch.cdist(sketches, sketches).pow(2)
+            off_diag = ~torch.eye(len(flats), dtype=torch.bool, device=self.device)
+            error['distance'] = ((approx - exact).abs() / exact.clamp(min=1e-30))[off_diag].max().item()
+        return error
+
+    def report(self, flats, sketches):
+        """
+        log the sketching error measured on the first sketched rows
+        """
+        if self.reported:
+            return
+        self.reported = True
+        error = self.relative_error(flats, sketches)
+        logger.info(f"{self.method} sketch {self.layout.numel} -> {self.sketch_dim}: max relative error " +
+                    ", ".join(f"{k} {v:.4f}" for k, v in error.items()))
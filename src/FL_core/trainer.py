@@ -8,15 +8,18 @@ from torch.utils.data import DataLoader
 import numpy as np
 from sklearn.metrics import roc_auc_score
 
+from .batch_loader import batch_loader, global_shuffle_order
+
 
 class Trainer:
-    def __init__(self, args):
+    def __init__(self, args, model_pool=None):
         """
         trainer
         ---
         Args
             model: given model  for training (or test)
             args: arguments for FL training
+            model_pool: optional ModelPool to borrow the local model from
         """
         self.device = args.device
         self.num_classes = args.num_classes
@@ -32,7 +35,10 @@ class Trainer:
 
         # model
         self.model = None
+        self.model_pool = model_pool
         self.client_optimizer = args.client_optimizer
+        # per-sample (outputs, losses) of the last local epoch, with `args.capture_outputs`
+        self.captured = None
 
 
     def get_model(self):
@@ -46,24 +52,38 @@ class Trainer:
         """
         set current model for training
         """
-        if self.model is None:
+        if self.model_pool is not None:
+            # the pool holds the broadcast copy of the global model
+            if self.model is None:
+                self.model = self.model_pool.acquire(model)
+            else:
+                self.model_pool.fill(self.model, model)
+        elif self.model is None:
             self.model = deepcopy(model)
         else:
             self.model.load_state_dict(model.state_dict())
     
     def clear_model(self):
+        if self.model_pool is not None and self.model is not None:
+            self.model_pool.release(self.model)
         self.model = None
+        self.captured = None
 
-    def train(self, data, mu=0, global_model=None):
+    def train(self, data, mu=0, global_model=None, shuffle_seed=None):
         """
         train
         ---
         Args
             data: dataset for training
+            shuffle_seed: seed of the per-epoch sample order (default: drawn
+                from the global RNG, as a shuffling DataLoader does)
         Returns
             accuracy, loss
         """
-        dataloader = DataLoader(data, **self.loader_kwargs)
+        generator = None
+        if shuffle_seed is not None:
+            generator = torch.Generator()
+            generator.manual_seed(shuffle_seed)
 
         self.model.to(self.device)
         
@@ -77,17 +97,30 @@ class Trainer:
 
         criterion = nn.CrossEntropyLoss()
         
+        num_samples = 0  # over all local epochs
+        self.captured = None
         for epoch in range(self.num_epoch):
-            loss_lst = []
-            output_lst, res_lst = torch.empty((0, self.num_classes)).to(self.device), torch.empty((0, self.num_classes)).to(self.device)
-            min_loss, num_ot = np.inf, 0
-            train_loss, correct, total = 0., 0, 0
-            probs = 0
+            if generator is None:
+                order = global_shuffle_order(len(data))
+            else:
+                order = torch.randperm(len(data), generator=generator).tolist()
+            dataloader = batch_loader(data, self.batch_size, order=order, device=self.device)
+            capture = self.args.capture_outputs and epoch == self.num_epoch - 1
+            if capture:
+                # the sample index of every batch position, from the sample order;
+                # samples the epoch does not reach (with `num_updates`) stay nan
+                sample_idxs = torch.as_tensor(order, device=self.device)
+                captured_outputs = torch.full((len(data), self.num_classes), np.nan, device=self.device)
+                captured_losses = torch.full((len(data),), np.nan, device=self.device)
+            # statistics of the last epoch, accumulated on the device and read
+            # back once after training, so the steps never wait for the host
+            train_loss = torch.zeros((), dtype=torch.float64, device=self.device)
+            correct = torch.zeros((), dtype=torch.long, device=self.device)
+            total = 0
             for num_update, (input, labels) in enumerate(dataloader):
-                input, labels = input.to(self.device), labels.to(self.device)
+                input, labels = input.to(self.device, non_blocking=True), labels.to(self.device, non_blocking=True)
                 optimizer.zero_grad()
                 output = self.model(input)
-                _, preds = torch.max(output.detach().data, 1)
 
                 loss = criterion(output, labels.long())
 
@@ -104,10 +137,15 @@ class Trainer:
                 loss.backward()
                 optimizer.step()
 
-                train_loss += loss.detach().item() * input.size(0)
-                
-                correct += preds.eq(labels).sum().detach().cpu().data.numpy()
+                if capture:
+                    idxs = sample_idxs[total: total + input.size(0)]
+                    captured_outputs[idxs] = output.detach()
+                    captured_losses[idxs] = F.cross_entropy(output.detach(), labels.long(), reduction='none')
+
+                train_loss += loss.detach().double() * input.size(0)
+                correct += output.detach().argmax(1).eq(labels).sum()
                 total += input.size(0)
+                num_samples += input.size(0)
 
                 if self.num_updates is not None and num_update + 1 == self.num_updates:
                     if total < self.batch_size:
@@ -119,8 +157,12 @@ class Trainer:
         self.model = self.model.cpu()
 
         assert total > 0
-            
-        result = {'loss': train_loss / total, 'acc': correct / total, 'metric': train_loss / total}
+
+        train_loss, correct = train_loss.item(), correct.item()
+        if self.args.capture_outputs:
+            self.captured = (captured_outputs.cpu().numpy(), captured_losses.cpu().numpy())
+        result = {'loss': train_loss / total, 'acc': correct / total, 'metric': train_loss / total,
+                  'num_samples': num_samples}
         
         # if you track each client's loss
         # sys.stdout.write(r'\nLoss {:.6f} Acc {:.4f}'.format(result['loss'], result['acc']))
@@ -173,7 +215,7 @@ class Trainer:
 
         sys.stdout.write('\rTrainLoss {:.6f} TrainAcc {:.4f}'.format(avg_loss, train_acc))
 
-        result = {'loss': avg_loss.detach().cpu(), 'acc': train_acc}
+        result = {'loss': avg_loss.detach().cpu(), 'acc': train_acc, 'num_samples': total}
 
         return result
 
@@ -188,7 +230,9 @@ class Trainer:
         Returns
             accuracy, loss, AUC (optional)
         """
-        dataloader = DataLoader(data, **self.loader_kwargs)
+        # no shuffling: the order does not matter and must not consume the
+        # global RNG (tests may run in a background thread)
+        dataloader = batch_loader(data, self.batch_size, device=self.device)
         
         if use_local_model:
             print("You are now using local model for testing")
@@ -232,40 +276,65 @@ class Trainer:
 
         return result
     
-    def elementwise_test(self, model, data, ema=False):
+    def captured_outputs(self):
+        """
+        per-sample outputs and losses of the last local epoch of the last
+        training, in sample order; None unless captured for every sample
+        """
+        if self.captured is None or np.isnan(self.captured[1]).any():
+            return None
+        return self.captured
+
+    def elementwise_test(self, model, data, ema=False, half=False):
         """
         forward pass
         ---
         Args
             model: model for test
             data: dataset for test
+            half: keep the outputs and losses in float16
         Returns
             elementwise output and loss
         """
-        torch.backends.cudnn.deterministic = True
-        torch.backends.cudnn.benchmark = False
-        
-        _kwargs = {'batch_size': self.batch_size, 'pin_memory': True, 'shuffle': False}
-        dataloader = DataLoader(data, **_kwargs)
+        dataloader = batch_loader(data, self.batch_size, device=self.device)
         
         model = model.to(self.device)
         model.eval()
         
         criterion = nn.CrossEntropyLoss(reduction='none')
-
-        with torch.no_grad():
-            test_loss, correct, total = 0., 0, 0
-            y_true, y_score = np.empty((0)), np.empty((0))
-            output_lst, res_lst = torch.empty((0, self.num_classes)), torch.empty((0, self.num_classes))
-
-            for i, (input, labels) in enumerate(dataloader):
-                input, labels = input.to(self.device), labels.to(self.device)
-                output = model(input)
-                loss = criterion(output, labels.long())
-                if i == 0:
-                    output_whole = np.array(output.cpu())
-                    loss_whole = np.array(loss.cpu())
-                else:
-                    output_whole = np.concatenate((output_whole, output.cpu()), axis=0)
-                    loss_whole = np.concatenate((loss_whole, loss.cpu()), axis=0)       
-        return output_whole, loss_whole
\ No newline at end of file
+        return elementwise_outputs(model, dataloader, len(data), self.device, criterion=criterion, half=half)
+
+
+@torch.no_grad()
+def elementwise_outputs(forward, batches, num_samples, device, criterion=None, half=False):
+    """
+    per-sample outputs of a forward pass over batches, written batch by batch
+    into arrays preallocated for `num_samples` samples
+    ---
+    Args
+        forward: model, or callable from inputs to outputs
+        batches: iterable of (input, labels)
+        criterion: optional per-sample loss of (outputs, labels)
+        half: keep the outputs and losses in float16
+    Returns
+        outputs (num_samples x ...), and losses (num_samples,) with a criterion
+    """
+    dtype = np.float16 if half else np.float32
+    output_whole, loss_whole = None, None
+    start = 0
+    for input, labels in batches:
+        input, labels = input.to(device), labels.to(device).long()
+        output = forward(input)
+        end = start + len(output)
+        if output_whole is None:
+            output_whole = np.empty((num_samples,) + tuple(output.shape[1:]), dtype=dtype)
+        output_whole[start: end] = output.cpu().numpy()
+        if criterion is not None:
+            if loss_whole is None:
+                loss_whole = np.empty(num_samples, dtype=dtype)
+            loss_whole[start: end] = criterion(output, labels).cpu().numpy()
+        start = end
+    assert start == num_samples, (start, num_samples)
+    if criterion is not None:
+        return output_whole, loss_whole
+    return output_whole
@@ -131,4 +131,6 @@ if __name__ == '__main__':
     ## train
     # set federated optim algorithm
     ServerExecute = Server(dataset, model, args, client_selection, fed_algo, files)
+    if args.resume:
+        ServerExecute.load_checkpoint(args.resume)
     ServerExecute.train()
@@ -16,6 +16,7 @@ def save_files(args):
         add += '_total'
     path = f'./results/{args.dataset}/{args.method}{alpha}{dirichlet_alpha}{add}-{args.start}'
     os.makedirs(path, exist_ok=True)
+    args.save_path = path
     if args.loss_sum:
         args.comment += '_total'
     elif args.loss_div_sqrt:
@@ -34,6 +35,10 @@ def save_files(args):
 
     result_files['client'] = open(f'{path}/client_{args.file_name_opt}_{args.start}.txt', 'w')
 
+    if args.profile:
+        # per-phase timings of every round, one JSON record per line
+        result_files['trace'] = open(f'{path}/trace_{args.file_name_opt}_{args.start}.jsonl', 'w')
+
     if args.save_probs:
         result_files['prob'] = open(f'{path}/probs_{args.file_name_opt}_{args.start}.txt', 'w')
         result_files['num_samples'] = open(f'{path}/num_samples_{args.file_name_opt}_{args.start}.txt', 'w')
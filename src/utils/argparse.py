@@ -60,6 +60,22 @@ def get_args():
     parser.add_argument('--distance_type', type=str, default='L1', help='distance type for clustered sampling 2')
     parser.add_argument('--subset_ratio', type=float, default=0.1, help='subset size for DivFL')
 
+    parser.add_argument('--sketch_dim', type=int, default=None,
+                        help='compare clients\' model deltas on sketches of this dimension (DivFL, Cluster2, PBFL, Cosin); '
+                             'default: full deltas')
+    parser.add_argument('--sketch_method', type=str, default='count', choices=['count', 'jl'],
+                        help='count-sketch or dense Johnson-Lindenstrauss projection for --sketch_dim')
+    parser.add_argument('--metric_staleness', type=int, default=None,
+                        help='post-selection methods (AFL, Pow-d, DivFL, GradNorm) reuse a client\'s metric for this '
+                             'many rounds and train only stale candidates and the selected clients; default: train all')
+    parser.add_argument('--probe_loss', action='store_true', default=False,
+                        help='Pow-d: score the candidates by the global model\'s loss on their data (forward only) '
+                             'and train only the selected clients')
+    parser.add_argument('--probe_samples', type=int, default=None,
+                        help='number of samples per candidate for --probe_loss (default: all)')
+    parser.add_argument('--capture_outputs', action='store_true', default=False,
+                        help='FedCorr: record per-sample outputs and losses of the last local epoch and use them '
+                             'instead of a second forward pass over the trained clients\' data')
     parser.add_argument('--dirichlet_alpha', type=float, default=None, help='ratio of data partition from dirichlet distribution')
     
     parser.add_argument('--min_num_samples', type=int, default=None, help='mininum number of samples')
@@ -121,6 +137,25 @@ def get_args():
     parser.add_argument('--parallel', action='store_true', default=False, help='use multi GPU')
     parser.add_argument('--use_mp', action='store_true', default=False, help='use multiprocessing')
     parser.add_argument('--nCPU', type=int, default=None, help='number of CPU cores for multiprocessing')
+    parser.add_argument('--mp_backend', type=str, default='thread', choices=['thread', 'process'],
+                        help='local training with --use_mp on a thread pool or on long-lived worker processes')
+    parser.add_argument('--mp_timeout', type=float, default=None,
+                        help='with --mp_backend process, seconds to wait for the next client to finish training (default: no limit)')
+    parser.add_argument('--cohort_size', type=int, default=None,
+                        help='train this many clients at once with vmap over stacked models (small models, sgd only)')
+    parser.add_argument('--seeded_shuffle', action='store_true', default=False,
+                        help='draw the sample order of in-process local training from per-client seeds, as the '
+                             'process pool and cohort training do (default: the global RNG)')
+    parser.add_argument('--model_pool_size', type=int, default=None,
+                        help='number of idle local model instances kept for reuse (0: deepcopy per client); '
+                             'default: number of local models alive in a round')
+    parser.add_argument('--pipeline_eval', action='store_true', default=False,
+                        help='evaluate the global model of round t in the background during round t+1')
+    parser.add_argument('--checkpoint_freq', type=int, default=0,
+                        help='checkpoint the whole server state every this many rounds (0: never)')
+    parser.add_argument('--resume', type=str, default=None, help='checkpoint file to resume training from')
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help='write per-phase timings of every round to a JSONL trace next to the results')
     parser.add_argument('--save_probs', action='store_true', default=False, help='save probs')
     parser.add_argument('--no_save_results', action='store_true', default=False, help='save results')
     parser.add_argument('--test_freq', type=int, default=1, help='test all frequency')
@@ -131,6 +166,12 @@ def get_args():
                         '2): --ucb_alpha=linear_a, alpha = a * step'
                         '3): --ucb_alpha=round_, alpha= step / 100 if step < 100 else 200 / (step + 100)')
 
+    # PBFL reward statistics
+    parser.add_argument('--bandit_window', type=int, default=None,
+                        help='PBFL/Cosin: mean over the last this many rewards of each client (default: all)')
+    parser.add_argument('--bandit_discount', type=float, default=None,
+                        help='PBFL/Cosin: discount rewards by this factor per update round (default: no discount)')
+
     # Others
     parser.add_argument('--comment', type=str, default='', help='comment')
     args = parser.parse_args()
@@ -0,0 +1,108 @@
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+import torch
+from torch.utils.data import TensorDataset
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+# FL_core modules bind `utils.logger` when imported, so it is initialized
+# before any test module imports them, as main.py does
+import utils
+_argv, sys.argv = sys.argv, ['main.py']
+utils.init(tempfile.mkdtemp(), 'test')
+sys.argv = _argv
+
+
+def toy_data(num_clients, num_classes=3, dim=5, seed=0):
+    """
+    small per-client TensorDatasets in the layout of `data.load_data`
+    """
+    g = torch.Generator().manual_seed(seed)
+    def dataset(n):
+        return TensorDataset(torch.randn(n, dim, generator=g),
+                             torch.randint(0, num_classes, (n,), generator=g).float())
+    train = {i: dataset(20 + 3 * i) for i in range(num_clients)}
+    test = {i: dataset(10) for i in range(num_clients)}
+    return {'train': {'data': train, 'data_sizes': {i: len(d) for i, d in train.items()}},
+            'test': {'data': test, 'data_sizes': {i: len(d) for i, d in test.items()}}}
+
+
+def toy_model(dim=5, num_classes=3):
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(dim, 7), torch.nn.ReLU(), torch.nn.Linear(7, num_classes))
+
+
+def trainer_args(**kwargs):
+    """
+    default command-line arguments of a CPU trainer on the toy data
+    """
+    from utils.argparse import get_args
+    argv, sys.argv = sys.argv, ['main.py']
+    try:
+        args = get_args()
+    finally:
+        sys.argv = argv
+    args.gpu_id = args.device = 'cpu'
+    args.num_classes = 3
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    return args
+
+
+def random_selection(args, **kwargs):
+    from FL_core.client_selection import RandomSelection
+    return RandomSelection(**kwargs)
+
+
+@pytest.fixture
+def fl_core():
+    """
+    importer of FL_core modules: fl_core('client_selection.pairwise'). The
+    client selection package (imported by most of FL_core) needs the FedCor
+    submodule, so the test is skipped without it
+    """
+    pytest.importorskip('fedcor')
+    return lambda name: importlib.import_module(f'FL_core.{name}')
+
+
+@pytest.fixture
+def make_server(tmp_path, monkeypatch, fl_core):
+    """
+    factory of a small CPU server: make_server(method, selection_factory, data=None, **args)
+    """
+    pytest.importorskip('wandb')
+    monkeypatch.setattr(sys, 'argv', ['main.py'])
+    from utils.argparse import get_args
+    Server = fl_core('server').Server
+    federated_algorithm = fl_core('federated_algorithm')
+
+    def make(method, selection_factory, num_clients=6, data=None, **kwargs):
+        args = get_args()
+        args.gpu_id = args.device = 'cpu'
+        args.method = method
+        args.dataset = 'toy'
+        args.num_classes = 3
+        args.total_num_client = args.total_num_clients = num_clients
+        args.num_clients_per_round = 3
+        args.num_candidates = 4
+        args.num_round = 3
+        args.wandb = False
+        args.no_save_results = True
+        args.data_dir = args.save_path = str(tmp_path)
+        args.file_name_opt = 'test'
+        for k, v in kwargs.items():
+            setattr(args, k, v)
+        data = toy_data(num_clients) if data is None else data
+        model = toy_model()
+        selection = selection_factory(args, total=num_clients, device='cpu')
+        files = {'client': open(os.devnull, 'w'), 'result': open(os.devnull, 'w')}
+        if args.fed_algo == 'FedAdam':
+            fed_algo = federated_algorithm.FedAdam(data['train']['data_sizes'], model, args=args)
+        else:
+            fed_algo = federated_algorithm.FedAvg(data['train']['data_sizes'], model)
+        return Server(data, model, args, selection, fed_algo, files)
+    return make
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import toy_model
+from FL_core.federated_algorithm import FedAvg
+
+
+def perturbed_models(n):
+    models = []
+    for k in range(n):
+        model = toy_model()
+        with torch.no_grad():
+            for p in model.parameters():
+                p.add_(torch.randn(p.shape, generator=torch.Generator().manual_seed(k)))
+        models.append(model)
+    return models
+
+
+def test_streaming_matches_batch_aggregation():
+    train_sizes = {0: 20, 1: 35, 2: 7, 3: 12}
+    client_indices = [3, 0, 2]
+    models = perturbed_models(len(client_indices))
+
+    batch = FedAvg(train_sizes, toy_model()).update(models, client_indices)
+
+    streaming = FedAvg(train_sizes, toy_model())
+    streaming.begin_round(client_indices)
+    for client_idx, model in zip(client_indices, models):
+        streaming.add_client_update(client_idx, model)
+    streamed = streaming.finalize()
+
+    assert batch.keys() == streamed.keys()
+    for key in batch:
+        torch.testing.assert_close(streamed[key], batch[key])
+
+
+def test_batch_aggregation_matches_weighted_average():
+    train_sizes = {0: 20, 1: 35, 2: 7}
+    client_indices = [0, 1, 2]
+    models = perturbed_models(len(client_indices))
+
+    aggregated = FedAvg(train_sizes, toy_model()).update(models, client_indices)
+
+    total = sum(train_sizes.values())
+    for key, value in aggregated.items():
+        expected = sum(model.state_dict()[key] * train_sizes[idx] / total
+                       for idx, model in zip(client_indices, models))
+        torch.testing.assert_close(value, expected)
+
+
+@pytest.mark.parametrize('backend', [{}, {'use_mp': True, 'nCPU': 2},
+                                     {'use_mp': True, 'nCPU': 2, 'mp_backend': 'process'},
+                                     {'cohort_size': 2}])
+def test_duplicate_clients_in_pre_selected_cohort(make_server, backend):
+    from FL_core.client_selection import ClusteredSampling1
+    server = make_server('Cluster1', lambda args, **kw: ClusteredSampling1(**kw, n_cluster=3), **backend)
+    # sampling with replacement can select a client more than once
+    server.selection_method.select = lambda *args, **kwargs: np.array([1, 1, 2])
+    assert not server.can_stream_aggregation([1, 1, 2])
+    server.train()
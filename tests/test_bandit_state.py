@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+
+def naive_means(history, num_updates, window=None, discount=None):
+    # recompute every mean from the full history of (update round, reward)
+    means = []
+    for rewards in history:
+        t, r = np.array(rewards).T
+        if window is not None:
+            t, r = t[-window:], r[-window:]
+        weights = np.ones_like(r) if discount is None else discount ** (num_updates - t)
+        means.append((weights * r).sum() / weights.sum())
+    return np.array(means)
+
+
+@pytest.mark.parametrize('window, discount', [(None, None), (1, None), (3, None), (None, 0.9), (None, 0.5)])
+def test_statistics_match_the_full_history(fl_core, window, discount):
+    BanditState = fl_core('client_selection.bandit_state').BanditState
+    total = 12
+    rng = np.random.default_rng(0)
+    bandit = BanditState(total, window=window, discount=discount)
+    assert np.all(bandit.means() == -np.inf)
+
+    # every client starts with one zero reward
+    history = [[(0, 0.)] for _ in range(total)]
+    for update in range(1, 40):
+        clients = rng.choice(total, rng.integers(1, total), replace=False)
+        rewards = rng.normal(size=len(clients))
+        bandit.add_selections(clients)
+        bandit.add_rewards(clients, rewards)
+        for client, reward in zip(clients, rewards):
+            history[client].append((update, reward))
+        np.testing.assert_allclose(bandit.means(), naive_means(history, update, window, discount), rtol=1e-9)
+
+    np.testing.assert_array_equal(bandit.selected_cnt, [len(rewards) - 1 for rewards in history])
+
+
+@pytest.mark.parametrize('size, n', [(10, 1), (50, 7), (50, 49), (30, 30), (30, 40)])
+def test_top_n_matches_argsort(fl_core, size, n):
+    top_n = fl_core('client_selection.bandit_state').top_n
+    scores = np.random.default_rng(size + n).permutation(size) / size  # no ties
+    top = top_n(scores, n)
+    assert set(top) == set(np.argsort(-scores)[:n])
+    np.testing.assert_array_equal(top, np.argsort(-scores)[:n])
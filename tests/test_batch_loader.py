@@ -0,0 +1,34 @@
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+
+from FL_core.batch_loader import batch_loader, global_shuffle_order
+
+
+def dataset(n=23):
+    g = torch.Generator().manual_seed(0)
+    return TensorDataset(torch.randn(n, 4, generator=g), torch.randint(0, 3, (n,), generator=g).float())
+
+
+def test_global_shuffle_order_draws_as_a_shuffling_dataloader():
+    data = dataset()
+    torch.manual_seed(3)
+    expected = [labels for _, labels in DataLoader(data, batch_size=5, shuffle=True)]
+    after_dataloader = torch.rand(3)
+
+    torch.manual_seed(3)
+    batches = [labels for _, labels in batch_loader(data, 5, order=global_shuffle_order(len(data)))]
+    # same batches, and the global RNG is left in the same state
+    assert len(batches) == len(expected)
+    for batch, expected_batch in zip(batches, expected):
+        torch.testing.assert_close(batch, expected_batch)
+    torch.testing.assert_close(torch.rand(3), after_dataloader)
+
+
+def test_sequential_batches_match_dataloader():
+    data = dataset()
+    expected = list(DataLoader(data, batch_size=5))
+    batches = list(batch_loader(data, 5))
+    assert len(batches) == len(expected)
+    for (input, labels), (expected_input, expected_labels) in zip(batches, expected):
+        torch.testing.assert_close(input, expected_input)
+        torch.testing.assert_close(labels, expected_labels)
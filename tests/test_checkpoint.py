@@ -0,0 +1,115 @@
+import os
+import random
+import time
+
+import numpy as np
+import pytest
+import torch
+
+from FL_core import checkpoint
+
+
+def seed_everything(seed=0):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+def assert_same(value, expected, path='state'):
+    if isinstance(expected, dict):
+        assert value.keys() == expected.keys(), path
+        for k in expected:
+            assert_same(value[k], expected[k], f'{path}.{k}')
+    elif isinstance(expected, (list, tuple)):
+        assert len(value) == len(expected), path
+        for k, (v, e) in enumerate(zip(value, expected)):
+            assert_same(v, e, f'{path}[{k}]')
+    elif torch.is_tensor(expected):
+        torch.testing.assert_close(value, expected, rtol=0, atol=0, msg=path)
+    elif isinstance(expected, np.ndarray):
+        np.testing.assert_array_equal(value, expected, err_msg=path)
+    elif isinstance(expected, torch.nn.Module):
+        assert_same(value.state_dict(), expected.state_dict(), path)
+    elif hasattr(expected, '__dict__') and not callable(expected):
+        assert type(value) is type(expected), path
+        assert_same(vars(value), vars(expected), path)
+    else:
+        assert value == expected, path
+
+
+def divfl(args, **kwargs):
+    from FL_core.client_selection import DivFL
+    return DivFL(**kwargs, subset_ratio=0.5)
+
+
+def pbfl(args, **kwargs):
+    from FL_core.client_selection import Proj_Bandit
+    return Proj_Bandit(args, **kwargs)
+
+
+@pytest.mark.parametrize('method, selection_factory, options', [
+    ('DivFL', divfl, dict(sketch_dim=8, metric_staleness=2)),
+    ('PBFL', pbfl, dict(warmup=2, ucb_alpha='round_', bandit_window=3)),
+])
+def test_resume_matches_an_uninterrupted_run(make_server, tmp_path, method, selection_factory, options):
+    num_round, stop = 5, 2
+    options = dict(options, fed_algo='FedAdam', lr_global=0.01)
+
+    seed_everything()
+    straight = make_server(method, selection_factory, num_round=num_round, **options)
+    straight.train()
+    expected = straight.state_dict(num_round)
+
+    seed_everything()
+    first = make_server(method, selection_factory, num_round=stop, checkpoint_freq=stop, **options)
+    first.train()
+    path = first.checkpoint_writer.path
+    assert os.path.exists(path) and not os.path.exists(path + '.tmp')
+
+    seed_everything(1)  # the RNG streams come from the checkpoint
+    resumed = make_server(method, selection_factory, num_round=num_round, **options)
+    resumed.load_checkpoint(path)
+    assert resumed.start_round == stop
+    resumed.train()
+    state = resumed.state_dict(num_round)
+
+    assert_same(state['global_model'], expected['global_model'])
+    assert_same(state['rng'], expected['rng'])
+    assert_same(state['fed_algo'], expected['fed_algo'])
+    assert_same(state['selection'], expected['selection'])
+    assert_same(state.get('metric_cache'), expected.get('metric_cache'))
+    assert state['num_trainings'] == expected['num_trainings']
+    assert state['lr_local'] == expected['lr_local']
+
+
+def test_save_atomic_keeps_the_previous_checkpoint_on_failure(tmp_path, monkeypatch):
+    path = str(tmp_path / 'checkpoint.pt')
+    checkpoint.save_atomic({'round': 1}, path)
+    assert torch.load(path) == {'round': 1}
+    assert not os.path.exists(path + '.tmp')
+
+    def failing_save(obj, f):
+        with open(f, 'wb') as out:
+            out.write(b'trunc')
+        raise OSError('disk full')
+    monkeypatch.setattr(checkpoint.torch, 'save', failing_save)
+    with pytest.raises(OSError):
+        checkpoint.save_atomic({'round': 2}, path)
+    assert torch.load(path) == {'round': 1}
+
+
+def test_writer_drains_on_close(tmp_path, monkeypatch):
+    save_atomic = checkpoint.save_atomic
+    def slow_save(obj, path):
+        time.sleep(0.2)
+        save_atomic(obj, path)
+    monkeypatch.setattr(checkpoint, 'save_atomic', slow_save)
+
+    path = str(tmp_path / 'checkpoint.pt')
+    writer = checkpoint.CheckpointWriter(path)
+    writer.write({'round': 1})
+    writer.write({'round': 2})  # waits for the first write
+    assert torch.load(path) == {'round': 1}
+    writer.close()
+    assert torch.load(path) == {'round': 2}
+    assert not os.path.exists(path + '.tmp')
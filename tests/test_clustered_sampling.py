@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+from scipy.cluster.hierarchy import fcluster, linkage
+
+
+def reference_distributions(n_samples, n_cluster):
+    # Algorithm 1: clients, in decreasing order of weight, pour a mass of
+    # n_cluster * weight into clusters of capacity 1, one after the other
+    weights = np.array([n_samples[i] for i in sorted(n_samples)], dtype=float)
+    weights /= weights.sum()
+    distri = np.zeros((n_cluster, len(weights)))
+    k, room = 0, 1.
+    for client in np.flip(np.argsort(weights)):
+        mass = weights[client] * n_cluster
+        while mass > 1e-12 and k < n_cluster:
+            poured = min(mass, room)
+            distri[k, client] += poured
+            mass, room = mass - poured, room - poured
+            if room <= 1e-12:
+                k, room = k + 1, 1.
+    return distri / distri.sum(1, keepdims=True)
+
+
+def dense(selector):
+    out = np.zeros((selector.n_cluster, selector.total))
+    for k in range(selector.n_cluster):
+        entries = slice(selector.cluster_ptr[k], selector.cluster_ptr[k + 1])
+        out[k, selector.cluster_clients[entries]] = selector.cluster_probs[entries]
+    return out
+
+
+@pytest.mark.parametrize('total, n_cluster, seed', [(7, 3, 0), (50, 5, 1), (120, 17, 2), (10, 10, 3)])
+def test_cluster_distributions_match_algorithm_1(fl_core, total, n_cluster, seed):
+    ClusteredSampling1 = fl_core('client_selection.clustered').ClusteredSampling1
+    rng = np.random.default_rng(seed)
+    n_samples = {i: int(rng.integers(1, 500)) for i in range(total)}
+    selector = ClusteredSampling1(total, 'cpu', n_cluster)
+    selector.setup(n_samples)
+    np.testing.assert_allclose(dense(selector), reference_distributions(n_samples, n_cluster), atol=1e-9)
+
+
+def test_alias_tables_reproduce_the_distributions(fl_core):
+    ClusteredSampling1 = fl_core('client_selection.clustered').ClusteredSampling1
+    rng = np.random.default_rng(0)
+    selector = ClusteredSampling1(80, 'cpu', 9)
+    selector.setup({i: int(rng.integers(1, 500)) for i in range(80)})
+    for k in range(selector.n_cluster):
+        entries = slice(selector.cluster_ptr[k], selector.cluster_ptr[k + 1])
+        size = entries.stop - entries.start
+        implied = selector.alias_prob[entries] / size
+        np.add.at(implied, selector.alias_idx[entries], (1 - selector.alias_prob[entries]) / size)
+        np.testing.assert_allclose(implied, selector.cluster_probs[entries], atol=1e-12)
+
+
+def test_sampling_frequencies(fl_core):
+    ClusteredSampling1 = fl_core('client_selection.clustered').ClusteredSampling1
+    total, n_cluster, draws = 30, 4, 20000
+    n_samples = {i: i + 1 for i in range(total)}
+    selector = ClusteredSampling1(total, 'cpu', n_cluster)
+    selector.setup(n_samples)
+    expected = reference_distributions(n_samples, n_cluster)
+
+    np.random.seed(0)
+    counts = np.zeros((n_cluster, total))
+    for _ in range(draws):
+        counts[np.arange(n_cluster), selector.select(n_cluster, list(range(total)))] += 1
+    np.testing.assert_allclose(counts / draws, expected, atol=0.02)
+
+    # with only some clients available, every cluster is renormalized over them
+    available = list(range(0, total, 3))
+    counts = np.zeros((n_cluster, total))
+    for _ in range(draws):
+        counts[np.arange(n_cluster), selector.select(n_cluster, available)] += 1
+    restricted = np.zeros_like(expected)
+    restricted[:, available] = expected[:, available]
+    restricted /= restricted.sum(1, keepdims=True)
+    np.testing.assert_allclose(counts / draws, restricted, atol=0.02)
+
+
+def reference_alg2(linkage_matrix, n_sampled, weights):
+    # the original loop of Algorithm 2
+    epsilon = int(10 ** 10)
+    link_matrix_p = linkage_matrix.copy()
+    augmented_weights = weights.copy()
+    for i in range(len(link_matrix_p)):
+        idx_1, idx_2 = int(link_matrix_p[i, 0]), int(link_matrix_p[i, 1])
+        new_weight = augmented_weights[idx_1] + augmented_weights[idx_2]
+        augmented_weights = np.concatenate((augmented_weights, [new_weight]))
+        link_matrix_p[i, 2] = int(new_weight * epsilon)
+    clusters = fcluster(link_matrix_p, int(epsilon / n_sampled), criterion="distance")
+    n_clients, n_clusters = len(clusters), len(set(clusters))
+
+    pop_clusters = np.zeros((n_clusters, 2)).astype(int)
+    for i in range(n_clusters):
+        pop_clusters[i, 0] = i + 1
+        for client in np.where(clusters == i + 1)[0]:
+            pop_clusters[i, 1] += int(weights[client] * epsilon * n_sampled)
+    pop_clusters = pop_clusters[pop_clusters[:, 1].argsort()]
+
+    distri_clusters = np.zeros((n_sampled, n_clients)).astype(int)
+    kept_clusters = pop_clusters[n_clusters - n_sampled:, 0]
+    for idx, cluster in enumerate(kept_clusters):
+        for client in np.where(clusters == cluster)[0]:
+            distri_clusters[idx, client] = int(weights[client] * n_sampled * epsilon)
+
+    k = 0
+    for j in pop_clusters[: n_clusters - n_sampled, 0]:
+        clients_in_j = np.where(clusters == j)[0]
+        np.random.shuffle(clients_in_j)
+        for client in clients_in_j:
+            weight_client = int(weights[client] * epsilon * n_sampled)
+            while weight_client > 0:
+                sum_proba_in_k = np.sum(distri_clusters[k])
+                u_i = min(epsilon - sum_proba_in_k, weight_client)
+                distri_clusters[k, client] = u_i
+                weight_client += -u_i
+                sum_proba_in_k = np.sum(distri_clusters[k])
+                if sum_proba_in_k == 1 * epsilon:
+                    k += 1
+
+    distri_clusters = distri_clusters.astype(float)
+    return distri_clusters / distri_clusters.sum(1, keepdims=True)
+
+
+@pytest.mark.parametrize('n_clients, n_sampled, weighting, seed', [
+    (5, 2, 'random', 0), (30, 4, 'random', 1), (60, 10, 'random', 2), (100, 15, 'random', 3),
+    (40, 5, 'uniform', 4), (25, 3, 'zero', 5), (12, 12, 'random', 6), (80, 1, 'random', 7)])
+def test_algorithm_2_matches_original_loop(fl_core, n_clients, n_sampled, weighting, seed):
+    ClusteredSampling2 = fl_core('client_selection.clustered').ClusteredSampling2
+    rng = np.random.default_rng(seed)
+    weights = np.ones(n_clients) if weighting == 'uniform' else rng.integers(1, 1000, n_clients).astype(float)
+    if weighting == 'zero':
+        weights[rng.integers(n_clients)] = 0
+    weights /= weights.sum()
+    linkage_matrix = linkage(rng.normal(size=(n_clients, 4)), 'ward')
+
+    np.random.seed(seed)
+    expected = reference_alg2(linkage_matrix, n_sampled, weights)
+    np.random.seed(seed)
+    distri_clusters = ClusteredSampling2(n_clients, 'cpu', 'L1').get_clusters_with_alg2(linkage_matrix, n_sampled, weights)
+    assert distri_clusters.shape == expected.shape
+    assert np.allclose(distri_clusters, expected)
+
+
+def test_cluster_without_available_clients(fl_core):
+    ClusteredSampling1 = fl_core('client_selection.clustered').ClusteredSampling1
+    total, n_cluster, draws = 30, 4, 20000
+    n_samples = {i: i + 1 for i in range(total)}
+    selector = ClusteredSampling1(total, 'cpu', n_cluster)
+    selector.setup(n_samples)
+    # only clients of the first cluster (the largest ones) are available
+    available = list(selector.cluster_clients[selector.cluster_ptr[0]: selector.cluster_ptr[1] - 1])
+    assert all(dense(selector)[k, available].sum() == 0 for k in range(2, n_cluster))
+
+    np.random.seed(0)
+    counts = np.zeros((n_cluster, total))
+    for _ in range(draws):
+        counts[np.arange(n_cluster), selector.select(n_cluster, available)] += 1
+    assert counts[:, np.setdiff1d(np.arange(total), available)].sum() == 0
+    # the empty clusters draw from the available clients by data size
+    by_size = np.array([n_samples[i] for i in available], dtype=float)
+    for k in range(2, n_cluster):
+        np.testing.assert_allclose(counts[k, available] / draws, by_size / by_size.sum(), atol=0.02)
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from conftest import toy_data, toy_model, trainer_args
+
+
+def test_supports_plain_sgd_only(fl_core):
+    CohortTrainer = fl_core('cohort_trainer').CohortTrainer
+    args = SimpleNamespace(client_optimizer='sgd', num_epoch=1, method='Random')
+    assert CohortTrainer.supports(toy_model(), args)
+    assert not CohortTrainer.supports(toy_model(), SimpleNamespace(**dict(vars(args), client_optimizer='adam')))
+    # GradNorm reads the gradients left on the local models, which cohort training does not set
+    assert not CohortTrainer.supports(toy_model(), SimpleNamespace(**dict(vars(args), method='GradNorm')))
+
+
+def make_clients(args, num_clients=5):
+    from FL_core.client import Client
+    data = toy_data(num_clients)
+    return [Client(i, len(data['train']['data'][i]), data['train']['data'][i], data['test']['data'][i], args)
+            for i in range(num_clients)]
+
+
+@pytest.mark.parametrize('options', [
+    dict(num_epoch=1, batch_size=8),
+    dict(num_epoch=3, batch_size=7, momentum=0.9, wdecay=1e-3),
+    dict(num_epoch=2, batch_size=5, num_updates=3, momentum=0.5),
+])
+def test_matches_sequential_training(fl_core, options):
+    CohortTrainer = fl_core('cohort_trainer').CohortTrainer
+    args = trainer_args(seeded_shuffle=True, **options)
+    model = toy_model()
+
+    # the sequential trainers draw their sample order from the same per-client seeds
+    sequential = make_clients(args)
+    expected = [client.train(model) for client in sequential]
+    cohort = make_clients(args)
+    results = CohortTrainer(args, model).train(model, cohort)
+
+    for result, expected_result, client, expected_client in zip(results, expected, cohort, sequential):
+        assert result['num_samples'] == expected_result['num_samples']
+        assert result['acc'] == pytest.approx(expected_result['acc'])
+        assert result['loss'] == pytest.approx(expected_result['loss'], rel=1e-5)
+        assert result['metric'] == pytest.approx(expected_result['metric'], rel=1e-5)
+        for param, expected_param in zip(client.trainer.model.parameters(),
+                                         expected_client.trainer.model.parameters()):
+            torch.testing.assert_close(param, expected_param, rtol=1e-5, atol=1e-6)
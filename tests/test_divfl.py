@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import torch
+
+
+def reference_lazy_greedy(norm_diff, num_select_clients):
+    # the original lazy greedy, with its bookkeeping of the previous candidate
+    SUi = set()
+    marg_util = norm_diff.sum(0)
+    i = marg_util.argmin()
+    L_s0 = 2. * marg_util.max()
+    marg_util = L_s0 - marg_util
+    client_min = norm_diff[:, i]
+    SUi.add(i)
+    S_util = marg_util[i]
+    marg_util[i] = -1.
+
+    while len(SUi) < num_select_clients:
+        argsort_V = np.argsort(marg_util)[len(SUi):]
+        for ni in range(len(argsort_V)):
+            i = argsort_V[-ni - 1]
+            SUi.add(i)
+            client_min_i = np.minimum(client_min, norm_diff[:, i])
+            SUi_util = L_s0 - client_min_i.sum()
+
+            marg_util[i] = SUi_util - S_util
+            if ni > 0:
+                if marg_util[i] < marg_util[pre_i]:
+                    if ni == len(argsort_V) - 1 or marg_util[pre_i] >= marg_util[argsort_V[-ni - 2]]:
+                        S_util += marg_util[pre_i]
+                        SUi.remove(i)
+                        SUi.add(pre_i)
+                        marg_util[pre_i] = -1.
+                        client_min = client_min_pre_i.copy()
+                        break
+                    else:
+                        SUi.remove(i)
+                else:
+                    if ni == len(argsort_V) - 1 or marg_util[i] >= marg_util[argsort_V[-ni - 2]]:
+                        S_util = SUi_util
+                        marg_util[i] = -1.
+                        client_min = client_min_i.copy()
+                        break
+                    else:
+                        pre_i = i
+                        SUi.remove(i)
+                        client_min_pre_i = client_min_i.copy()
+            else:
+                if marg_util[i] >= marg_util[argsort_V[-ni - 2]]:
+                    S_util = SUi_util
+                    marg_util[i] = -1.
+                    client_min = client_min_i.copy()
+                    break
+                else:
+                    pre_i = i
+                    SUi.remove(i)
+                    client_min_pre_i = client_min_i.copy()
+    return SUi
+
+
+def gradients(num_clients, dim, num_duplicates, seed):
+    rng = np.random.default_rng(seed)
+    grads = rng.normal(size=(num_clients, dim)).astype(np.float32)
+    # identical clients tie on every bound and every marginal gain
+    for k in range(num_duplicates):
+        grads[rng.integers(num_clients)] = grads[k]
+    return grads
+
+
+@pytest.mark.parametrize('num_clients, n, num_duplicates, seed', [
+    (10, 3, 0, 0), (30, 8, 0, 1), (50, 10, 0, 2), (20, 19, 0, 3),
+    (12, 5, 4, 4), (40, 15, 10, 5), (25, 6, 20, 6), (8, 2, 8, 7)])
+def test_lazy_greedy_matches_original(fl_core, num_clients, n, num_duplicates, seed):
+    DivFL = fl_core('client_selection.divfl').DivFL
+    selector = DivFL(num_clients, 'cpu', subset_ratio=0.1)
+    grads = gradients(num_clients, 6, num_duplicates, seed)
+    selector.norm_diff = ((grads[:, None] - grads[None]) ** 2).sum(-1)
+
+    expected = reference_lazy_greedy(selector.norm_diff.copy(), n)
+    assert selector.lazy_greedy(num_clients, n) == expected
+    assert len(expected) == n
+
+
+def test_selects_every_client(fl_core):
+    # the original loop fails on its last candidate here
+    DivFL = fl_core('client_selection.divfl').DivFL
+    selector = DivFL(9, 'cpu', subset_ratio=0.1)
+    grads = gradients(9, 6, 3, 9)
+    selector.norm_diff = ((grads[:, None] - grads[None]) ** 2).sum(-1)
+    assert selector.lazy_greedy(9, 9) == set(range(9))
+
+
+def test_select_on_gradients(fl_core):
+    DivFL = fl_core('client_selection.divfl').DivFL
+    selector = DivFL(30, 'cpu', subset_ratio=0.1)
+    grads = gradients(30, 6, 5, 8)
+    selected = selector.select(7, list(range(30)), torch.from_numpy(grads))
+    norm_diff = ((grads[:, None].astype(np.float64) - grads[None]) ** 2).sum(-1)
+    assert set(selected) == reference_lazy_greedy(norm_diff, 7)
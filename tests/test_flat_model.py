@@ -0,0 +1,51 @@
+import torch
+
+from FL_core.flat_model import FlatLayout
+
+
+def model_with_buffers():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Conv2d(3, 4, 3), torch.nn.BatchNorm2d(4), torch.nn.Flatten(),
+                                torch.nn.Linear(4 * 6 * 6, 5))
+    model(torch.randn(2, 3, 8, 8))  # non-trivial running statistics
+    return model
+
+
+def test_flatten_unflatten_round_trip():
+    model = model_with_buffers()
+    layout = FlatLayout(model)
+    flat = layout.flatten(model)
+    assert flat.shape == (sum(t.numel() for t in model.state_dict().values()),)
+
+    state = layout.unflatten(flat)
+    assert list(state.keys()) == list(model.state_dict().keys())
+    for key, tensor in model.state_dict().items():
+        torch.testing.assert_close(state[key], tensor.float())
+
+    other = model_with_buffers()
+    with torch.no_grad():
+        for p in other.parameters():
+            p.zero_()
+    layout.copy_to(flat, other)
+    for key, tensor in model.state_dict().items():
+        torch.testing.assert_close(other.state_dict()[key], tensor)
+
+
+def test_flatten_many_stacks_rows():
+    models = [model_with_buffers() for _ in range(3)]
+    with torch.no_grad():
+        for k, model in enumerate(models):
+            model[3].bias.add_(k)
+    layout = FlatLayout(models[0])
+    stacked = layout.flatten_many(models)
+    for row, model in zip(stacked, models):
+        torch.testing.assert_close(row, layout.flatten(model))
+
+
+def test_params_only_layout():
+    model = model_with_buffers()
+    layout = FlatLayout(model, params_only=True)
+    assert layout.names == [name for name, _ in model.named_parameters()]
+    flat = layout.flatten(model)
+    torch.testing.assert_close(flat, torch.cat([p.detach().reshape(-1) for p in model.parameters()]))
+    assert [numel for _, numel in layout.segments()] == [p.numel() for p in model.parameters()]
@@ -0,0 +1,30 @@
+import os
+
+import torch
+
+from conftest import random_selection, toy_data
+
+
+def cached_files(server):
+    return sorted(f for f in os.listdir(server.args.data_dir) if '_global_test_' in f)
+
+
+def test_cache_is_reused_for_the_same_partition(make_server):
+    first = make_server('Random', random_selection)
+    second = make_server('Random', random_selection)
+    assert len(cached_files(second)) == 1
+    torch.testing.assert_close(second.global_test_data.tensors, first.global_test_data.tensors)
+
+
+def test_cache_is_not_reused_across_partitions(make_server):
+    data = toy_data(6)
+    first = make_server('Random', random_selection, data=data)
+    # the same clients and sizes with one test sample moved to another client
+    test = data['test']['data']
+    x0, y0 = test[0].tensors
+    x1, y1 = test[1].tensors
+    test[0].tensors = (torch.cat([x0[1:], x1[:1]]), torch.cat([y0[1:], y1[:1]]))
+    test[1].tensors = (torch.cat([x0[:1], x1[1:]]), torch.cat([y0[:1], y1[1:]]))
+    second = make_server('Random', random_selection, data=data)
+    assert len(cached_files(second)) == 2
+    assert len(first.global_test_data) > 0 and len(second.global_test_data) > 0
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+
+def reference_lid(X, batch, k=20):
+    # full argsort of the whole distance matrix, one row at a time
+    eps = 1e-6
+    X, batch = np.asarray(X, dtype=np.float32), np.asarray(batch, dtype=np.float32)
+    distances = cdist(X, batch)
+    sort_indices = np.argsort(distances, axis=1)[:, 1:k + 1]
+    distances_ = np.take_along_axis(distances, sort_indices, axis=1)
+    return np.array([- k / (np.sum(np.log(v / (v[-1] + eps) + eps)) + eps) for v in distances_])
+
+
+@pytest.fixture
+def outputs():
+    rng = np.random.default_rng(0)
+    outputs = rng.random((57, 10)).astype(np.float32)
+    outputs[3] = outputs[4]  # tied distances
+    return outputs
+
+
+@pytest.mark.parametrize('block_bytes', [1, 4096, 64 * 1024 ** 2])
+def test_matches_full_sort(fl_core, outputs, block_bytes):
+    lid_term = fl_core('client_selection.fedcor_util').lid_term
+    np.testing.assert_allclose(lid_term(outputs, outputs, block_bytes=block_bytes),
+                               reference_lid(outputs, outputs), rtol=1e-12)
+
+
+def test_fewer_samples_than_neighbours(fl_core, outputs):
+    lid_term = fl_core('client_selection.fedcor_util').lid_term
+    small = outputs[:8]
+    np.testing.assert_allclose(lid_term(small, small, k=20), reference_lid(small, small, k=20), rtol=1e-12)
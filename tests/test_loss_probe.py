@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+
+from conftest import toy_data, toy_model, trainer_args
+from FL_core.client import Client
+from FL_core.loss_probe import LossProbe
+
+
+def make_clients(args, num_clients=5):
+    data = toy_data(num_clients)
+    return [Client(i, len(data['train']['data'][i]), data['train']['data'][i], data['test']['data'][i], args)
+            for i in range(num_clients)]
+
+
+def full_forward_loss(model, data, idxs=None):
+    input, labels = data.tensors
+    if idxs is not None:
+        input, labels = input[idxs], labels[idxs]
+    with torch.no_grad():
+        return F.cross_entropy(model(input), labels.long()).item()
+
+
+@pytest.mark.parametrize('batch_size, loss_div_sqrt', [(9, False), (1024, False), (9, True)])
+def test_whole_dataset_matches_a_full_forward(monkeypatch, batch_size, loss_div_sqrt):
+    monkeypatch.setattr(LossProbe, 'BATCH_SIZE', batch_size)
+    args = trainer_args(probe_samples=None, loss_div_sqrt=loss_div_sqrt)
+    clients, model = make_clients(args), toy_model()
+    selected = [clients[k] for k in [4, 1, 2]]
+
+    metrics = LossProbe(args).probe(model, selected, round_idx=0)
+    expected = [client.scale_metric({'metric': full_forward_loss(model, client.labeled_data)})['metric']
+                for client in selected]
+    assert metrics == pytest.approx(expected, rel=1e-6)
+    assert model.training
+
+
+def test_subsample_is_seeded_by_client_and_round():
+    args = trainer_args(probe_samples=6)
+    clients, model = make_clients(args), toy_model()
+    probe = LossProbe(args)
+    metrics = probe.probe(model, clients, round_idx=3)
+    assert metrics == probe.probe(model, clients, round_idx=3)
+
+    for client, metric in zip(clients, metrics):
+        idxs = probe._subsample(client, 3)
+        assert len(idxs) == 6 and len(np.unique(idxs)) == 6
+        assert metric == pytest.approx(full_forward_loss(model, client.labeled_data, idxs), rel=1e-6)
+    assert not np.array_equal(probe._subsample(clients[0], 3), probe._subsample(clients[0], 4))
@@ -0,0 +1,55 @@
+import numpy as np
+import torch
+
+
+def test_stale_until_trained_and_after_staleness(fl_core):
+    MetricCache = fl_core('client_selection.metric_cache').MetricCache
+    cache = MetricCache(total=5, staleness=2)
+    assert cache.stale([4, 0, 2], round_idx=0) == [4, 0, 2]
+
+    cache.update([0, 2], [0.5, 0.25], [1., 2.], round_idx=0)
+    assert cache.stale([4, 0, 2], round_idx=2) == [4]
+    assert cache.stale([4, 0, 2], round_idx=3) == [4, 0, 2]
+
+
+def test_zero_staleness_retrains_every_round(fl_core):
+    MetricCache = fl_core('client_selection.metric_cache').MetricCache
+    cache = MetricCache(total=3, staleness=0)
+    cache.update([0, 1, 2], [1., 2., 3.], [1., 2., 3.], round_idx=0)
+    assert cache.stale([0, 1, 2], round_idx=0) == []
+    assert cache.stale([0, 1, 2], round_idx=1) == [0, 1, 2]
+
+
+def test_get_returns_the_latest_metrics_in_order(fl_core):
+    MetricCache = fl_core('client_selection.metric_cache').MetricCache
+    cache = MetricCache(total=4, staleness=3)
+    cache.update([1, 3], [0.1, 0.3], [1., 3.], round_idx=0)
+    cache.update([1], [0.7], [2.], round_idx=1)
+    np.testing.assert_array_equal(cache.get([3, 1]), [0.3, 0.7])
+
+    rows = torch.arange(6.).view(2, 3)
+    sketches = MetricCache(total=4, staleness=3)
+    sketches.update([2, 0], rows, [1., 1.], round_idx=0)
+    sketches.update([], rows[:0], [], round_idx=1)
+    torch.testing.assert_close(sketches.get([0, 2]), rows.flip(0))
+
+
+def test_state_dict_is_a_snapshot(fl_core):
+    MetricCache = fl_core('client_selection.metric_cache').MetricCache
+    cache = MetricCache(total=3, staleness=1)
+    cache.update([0], torch.ones(1, 2), [1.], round_idx=0)
+    state = cache.state_dict()
+    cache.update([0], torch.zeros(1, 2), [0.], round_idx=1)
+
+    restored = MetricCache(total=3, staleness=1)
+    restored.load_state_dict(state)
+    torch.testing.assert_close(restored.get([0]), torch.ones(1, 2))
+    assert restored.stale([0, 1], round_idx=1) == [1]
+
+
+def test_round_without_stale_candidates(make_server):
+    from FL_core.client_selection import DivFL
+    server = make_server('DivFL', lambda args, **kwargs: DivFL(**kwargs, subset_ratio=0.1),
+                         sketch_dim=8, metric_staleness=5)
+    # every candidate is trained in round 0 and reuses its cached sketch afterwards
+    server.train()
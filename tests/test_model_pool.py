@@ -0,0 +1,73 @@
+import torch
+
+from conftest import toy_model, trainer_args
+from FL_core.flat_model import FlatLayout
+from FL_core.model_pool import ModelPool
+from FL_core.trainer import Trainer
+
+
+def shifted(model, value):
+    with torch.no_grad():
+        for p in model.parameters():
+            p.add_(value)
+    return model
+
+
+def assert_same_state(model, expected):
+    for key, tensor in expected.state_dict().items():
+        torch.testing.assert_close(model.state_dict()[key], tensor)
+
+
+def test_acquire_release_reuses_instances():
+    model = toy_model()
+    pool = ModelPool(model, FlatLayout(model), capacity=2)
+    pool.refresh(model)
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second and pool.num_created == 2
+    pool.release(first)
+    assert pool.acquire() is first
+    assert pool.num_created == 2
+
+
+def test_fill_after_refresh():
+    model = toy_model()
+    pool = ModelPool(model, FlatLayout(model), capacity=2)
+    pool.refresh(model)
+    pooled = pool.acquire()
+    pool.release(pooled)
+
+    shifted(model, 1.)
+    pool.refresh(model)
+    reused = pool.acquire()
+    assert reused is pooled
+    assert_same_state(reused, model)
+
+
+def test_evicts_the_least_recently_released():
+    model = toy_model()
+    pool = ModelPool(model, FlatLayout(model), capacity=2)
+    pool.refresh(model)
+    models = [pool.acquire() for _ in range(3)]
+    for m in models:
+        pool.release(m)
+    assert len(pool.idle) == 2
+    assert all(m is not models[0] for m in pool.idle)
+    assert {id(pool.acquire()), id(pool.acquire())} == {id(models[1]), id(models[2])}
+
+
+def test_trainer_set_model_with_a_pool():
+    model = toy_model()
+    pool = ModelPool(model, FlatLayout(model), capacity=2)
+    pool.refresh(model)
+    trainer = Trainer(trainer_args(), model_pool=pool)
+    trainer.set_model(model)
+    assert_same_state(trainer.model, model)
+
+    # a model other than the broadcast one is not ignored
+    other = shifted(toy_model(), 2.)
+    trainer.set_model(other)
+    assert_same_state(trainer.model, other)
+    trainer.clear_model()
+    trainer.set_model(other)
+    assert_same_state(trainer.model, other)
+    torch.testing.assert_close(pool.source, FlatLayout(model).flatten(model))
@@ -0,0 +1,21 @@
+import pytest
+
+from conftest import toy_data, toy_model, trainer_args
+from FL_core.packed_eval import PackedEvaluator
+from FL_core.trainer import Trainer
+
+
+@pytest.mark.parametrize('batch_size', [7, 1024])
+def test_matches_trainer_test(monkeypatch, batch_size):
+    # forward batches straddle clients when smaller than a test set
+    monkeypatch.setattr(PackedEvaluator, 'BATCH_SIZE', batch_size)
+    datasets = [data for _, data in sorted(toy_data(5)['test']['data'].items())]
+    model, trainer = toy_model(), Trainer(trainer_args())
+    evaluator = PackedEvaluator(datasets, 'cpu')
+
+    for client_idxs in [None, [3, 0, 4]]:
+        result = evaluator.evaluate(model, client_idxs)
+        clients = range(len(datasets)) if client_idxs is None else client_idxs
+        expected = [trainer.test(model, datasets[idx]) for idx in clients]
+        assert result['loss'] == pytest.approx([r['loss'] for r in expected], rel=1e-6)
+        assert result['acc'] == pytest.approx([r['acc'] for r in expected])
@@ -0,0 +1,53 @@
+import itertools
+
+import pytest
+import torch
+
+
+def reference_distances(grads, distance_type):
+    # the per-pair loop the blocked computation replaces, in float64
+    grads = grads.double()
+    n = len(grads)
+    out = torch.zeros(n, n, dtype=torch.float64)
+    for i, j in itertools.product(range(n), range(n)):
+        a, b = grads[i], grads[j]
+        if distance_type == 'L1':
+            out[i, j] = torch.sum(torch.abs(a - b))
+        elif distance_type == 'L2':
+            out[i, j] = torch.sum((a - b) ** 2)
+        else:
+            dot, na, nb = torch.dot(a, b), torch.sum(a ** 2), torch.sum(b ** 2)
+            out[i, j] = 0. if na == 0 or nb == 0 else torch.arccos(torch.clamp(dot / torch.sqrt(na * nb), -1, 1))
+    return out
+
+
+@pytest.fixture
+def grads():
+    grads = torch.randn(23, 301, generator=torch.Generator().manual_seed(0)) * 0.01
+    grads[5] = 0  # a client without update
+    grads[8] = grads[7]  # two identical updates
+    return grads
+
+
+@pytest.mark.parametrize('distance_type', ['L1', 'L2', 'cosine'])
+@pytest.mark.parametrize('block_bytes', [1, 50000, 256 * 1024 ** 2])
+def test_matches_per_pair_loop(fl_core, grads, distance_type, block_bytes):
+    pairwise_distances = fl_core('client_selection.pairwise').pairwise_distances
+    expected = reference_distances(grads, distance_type)
+    out = pairwise_distances(grads, distance_type, block_bytes=block_bytes)
+    assert out.dtype == torch.float32
+    torch.testing.assert_close(out, expected.float(), rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('distance_type', ['L1', 'L2', 'cosine'])
+def test_identical_updates_are_close(fl_core, grads, distance_type):
+    pairwise_distances = fl_core('client_selection.pairwise').pairwise_distances
+    out = pairwise_distances(grads, distance_type)
+    assert out.diagonal().abs().max() < 1e-6
+    assert out[7, 8].abs() < 1e-6
+
+
+def test_unknown_distance_type(fl_core, grads):
+    pairwise_distances = fl_core('client_selection.pairwise').pairwise_distances
+    with pytest.raises(ValueError):
+        pairwise_distances(grads, 'L3')
@@ -0,0 +1,30 @@
+import pytest
+
+from conftest import random_selection
+
+PROCESS_POOL = {'use_mp': True, 'nCPU': 2, 'mp_backend': 'process'}
+
+
+def test_worker_exception_is_raised_on_the_server(make_server):
+    server = make_server('Random', random_selection, batch_size=0, **PROCESS_POOL)
+    with pytest.raises(RuntimeError, match='must not be zero'):
+        server.train()
+    server.process_pool.close()
+
+
+def test_dead_worker_is_reported(make_server):
+    from FL_core.process_pool import ProcessPoolTrainer
+    server = make_server('Random', random_selection, **PROCESS_POOL)
+    pool = ProcessPoolTrainer(server.args, server.global_model, server.client_list, 2)
+    pool.workers[0].kill()
+    pool.workers[0].join()
+    with pytest.raises(RuntimeError, match='exited'):
+        pool.train(server.global_model, [(0, server.args.lr_local, 0, 0)])
+    for worker in pool.workers:
+        worker.terminate()
+
+
+def test_methods_reading_local_grads_train_in_process(make_server):
+    from FL_core.client_selection import GradNorm
+    server = make_server('GradNorm', lambda args, **kwargs: GradNorm(**kwargs), **PROCESS_POOL)
+    assert server.args.mp_backend == 'thread'
@@ -0,0 +1,25 @@
+import io
+import json
+import sys
+
+from FL_core.profiler import RoundProfiler
+
+
+def test_records_current_and_peak_rss():
+    trace = io.StringIO()
+    profiler = RoundProfiler(trace)
+    profiler.begin_round(0)
+    with profiler.phase('aggregation', num_clients=3):
+        pass
+    record = json.loads(trace.getvalue())
+    assert record['round'] == 0 and record['phase'] == 'aggregation' and record['num_clients'] == 3
+    assert record['peak_rss'] > 0
+    if sys.platform.startswith('linux'):
+        assert record['rss'] > 0
+
+
+def test_disabled_without_trace_file():
+    profiler = RoundProfiler(None)
+    with profiler.phase('aggregation'):
+        pass
+    profiler.record('local_train', 0., 1.)
@@ -0,0 +1,52 @@
+import pytest
+import torch
+import torch.nn.functional as F
+
+from conftest import toy_model
+from FL_core.flat_model import FlatLayout
+
+
+def reference_projections(deltas, global_delta, segments):
+    # the original per-client, per-layer loop of PBFL
+    grad_norm = [torch.sqrt(torch.sum(global_delta[offset: offset + numel] ** 2)) for offset, numel in segments]
+    return torch.tensor([[torch.dot(delta[offset: offset + numel], global_delta[offset: offset + numel]) / norm
+                          for (offset, numel), norm in zip(segments, grad_norm)] for delta in deltas])
+
+
+def reference_cosines(deltas, global_delta, segments):
+    # the original per-client, per-layer loop of Cosin
+    return torch.tensor([[F.cosine_similarity(delta[offset: offset + numel], global_delta[offset: offset + numel], dim=0)
+                          for offset, numel in segments] for delta in deltas])
+
+
+@pytest.fixture
+def deltas():
+    layout = FlatLayout(toy_model(), params_only=True)
+    g = torch.Generator().manual_seed(0)
+    deltas = torch.randn((6, layout.numel), generator=g)
+    global_delta = torch.randn(layout.numel, generator=g)
+    segments = list(layout.segments())
+    offset, numel = segments[1]
+    deltas[2, offset: offset + numel] = 0  # a layer left unchanged by a client
+    return deltas, global_delta, segments
+
+
+def test_segment_ids_tile_the_buffer(fl_core):
+    segment_ids = fl_core('client_selection.reward_kernel').segment_ids
+    segments = [(0, 3), (3, 1), (4, 5)]
+    assert segment_ids(segments).tolist() == [0, 0, 0, 1, 2, 2, 2, 2, 2]
+
+
+def test_projections_match_the_layer_loop(fl_core, deltas):
+    reward_kernel = fl_core('client_selection.reward_kernel')
+    deltas, global_delta, segments = deltas
+    projections = reward_kernel.layer_projections(deltas, global_delta, reward_kernel.segment_ids(segments), len(segments))
+    torch.testing.assert_close(projections, reference_projections(deltas, global_delta, segments))
+
+
+def test_cosines_match_the_layer_loop(fl_core, deltas):
+    reward_kernel = fl_core('client_selection.reward_kernel')
+    deltas, global_delta, segments = deltas
+    cosines = reward_kernel.layer_cosines(deltas, global_delta, reward_kernel.segment_ids(segments), len(segments))
+    torch.testing.assert_close(cosines, reference_cosines(deltas, global_delta, segments))
+    assert cosines[2, 1] == 0
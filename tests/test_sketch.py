@@ -0,0 +1,54 @@
+import pytest
+import torch
+
+from FL_core.flat_model import FlatLayout
+from FL_core.sketch import GradientSketch
+
+
+def layout():
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(120, 100), torch.nn.ReLU(), torch.nn.Linear(100, 1))
+    return FlatLayout(model, params_only=True)
+
+
+def correlated_rows(numel, n=6, seed=0):
+    g = torch.Generator().manual_seed(seed)
+    shared = torch.randn(numel, generator=g)
+    return torch.stack([shared * k / n + torch.randn(numel, generator=g) for k in range(n)])
+
+
+@pytest.mark.parametrize('method', ['count', 'jl'])
+def test_deterministic_for_a_seed(method):
+    flats = correlated_rows(layout().numel)
+    sketches = GradientSketch(layout(), 512, method, seed=3).sketch(flats)
+    torch.testing.assert_close(GradientSketch(layout(), 512, method, seed=3).sketch(flats), sketches, rtol=0, atol=0)
+    assert not torch.allclose(GradientSketch(layout(), 512, method, seed=4).sketch(flats), sketches)
+    # rows are sketched independently of each other
+    torch.testing.assert_close(GradientSketch(layout(), 512, method, seed=3).sketch(flats[2]), sketches[2],
+                               rtol=1e-4, atol=1e-4)
+
+
+@pytest.mark.parametrize('method', ['count', 'jl'])
+def test_blocks_by_layer(method):
+    flat_layout = layout()
+    sketch = GradientSketch(flat_layout, 512, method)
+    assert len(sketch) == sum(dim for _, dim in sketch.segments())
+    flats = correlated_rows(flat_layout.numel)
+    sketches = sketch.sketch(flats)
+    # the output bias is no larger than its share of the sketch and is kept exactly
+    for (src, numel), (dst, dim) in zip(flat_layout.segments(), sketch.segments()):
+        if dim == numel:
+            torch.testing.assert_close(sketches[:, dst: dst + dim], flats[:, src: src + numel])
+    assert sum(dim == numel for (_, numel), (_, dim) in zip(flat_layout.segments(), sketch.segments())) == 1
+
+
+@pytest.mark.parametrize('method', ['count', 'jl'])
+def test_preserves_inner_products(method):
+    flat_layout = layout()
+    flats = correlated_rows(flat_layout.numel).double()
+    sketches = GradientSketch(flat_layout, 4096, method).sketch(flats)
+    exact, approx = flats @ flats.T, sketches @ sketches.T
+    norms = exact.diag().sqrt()
+    # the error of <Sx, Sy> is of the order of |x| |y| / sqrt(sketch_dim)
+    assert ((approx - exact).abs() / torch.outer(norms, norms)).max() < 0.1
+    assert GradientSketch(flat_layout, 4096, method).relative_error(flats, sketches)['norm'] < 0.1
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+import torch
+
+from conftest import toy_data, toy_model, trainer_args
+from FL_core.batch_loader import batch_loader
+from FL_core.trainer import Trainer, elementwise_outputs
+
+
+def reference_train(model, data, args, shuffle_seed):
+    # the original loop, reading the statistics back with .item() every step
+    generator = torch.Generator()
+    generator.manual_seed(shuffle_seed)
+    model.train()
+    optimizer = torch.optim.SGD(model.parameters(), lr=args.lr_local, momentum=args.momentum, weight_decay=args.wdecay)
+    criterion = torch.nn.CrossEntropyLoss()
+    num_samples = 0
+    for epoch in range(args.num_epoch):
+        order = torch.randperm(len(data), generator=generator).tolist()
+        train_loss, correct, total = 0., 0, 0
+        for num_update, (input, labels) in enumerate(batch_loader(data, args.batch_size, order=order)):
+            optimizer.zero_grad()
+            output = model(input)
+            _, preds = torch.max(output.detach().data, 1)
+            loss = criterion(output, labels.long())
+            loss.backward()
+            optimizer.step()
+            train_loss += loss.detach().item() * input.size(0)
+            correct += preds.eq(labels).sum().detach().cpu().data.numpy()
+            total += input.size(0)
+            num_samples += input.size(0)
+            if args.num_updates is not None and num_update + 1 == args.num_updates:
+                break
+    return {'loss': train_loss / total, 'acc': correct / total, 'metric': train_loss / total,
+            'num_samples': num_samples}
+
+
+@pytest.mark.parametrize('options', [
+    dict(num_epoch=1, batch_size=8),
+    dict(num_epoch=3, batch_size=7, momentum=0.9, wdecay=1e-3),
+    dict(num_epoch=2, batch_size=5, num_updates=3),
+])
+def test_statistics_match_host_accumulation(options):
+    args = trainer_args(**options)
+    data = toy_data(3)['train']['data'][2]
+    expected_model = toy_model()
+    expected = reference_train(expected_model, data, args, shuffle_seed=11)
+
+    trainer = Trainer(args)
+    trainer.set_model(toy_model())
+    result = trainer.train(data, shuffle_seed=11)
+    assert result == pytest.approx(expected, rel=1e-12)
+    assert result['num_samples'] == expected['num_samples']
+    for param, expected_param in zip(trainer.model.parameters(), expected_model.parameters()):
+        torch.testing.assert_close(param, expected_param, rtol=0, atol=0)
+
+
+def reference_elementwise_test(model, data, batch_size):
+    # the original version, growing the arrays with np.concatenate
+    criterion = torch.nn.CrossEntropyLoss(reduction='none')
+    model.eval()
+    with torch.no_grad():
+        for i, (input, labels) in enumerate(batch_loader(data, batch_size)):
+            output = model(input)
+            loss = criterion(output, labels.long())
+            if i == 0:
+                output_whole = output.cpu().numpy()
+                loss_whole = loss.cpu().numpy()
+            else:
+                output_whole = np.concatenate((output_whole, output.cpu().numpy()), axis=0)
+                loss_whole = np.concatenate((loss_whole, loss.cpu().numpy()), axis=0)
+    return output_whole, loss_whole
+
+
+@pytest.mark.parametrize('batch_size', [1, 6, 64])
+def test_elementwise_outputs_match_concatenation(batch_size):
+    data = toy_data(5)['train']['data'][4]
+    model = toy_model()
+    expected_outputs, expected_losses = reference_elementwise_test(model, data, batch_size)
+
+    outputs, losses = Trainer(trainer_args(batch_size=batch_size)).elementwise_test(model, data)
+    assert outputs.dtype == losses.dtype == np.float32
+    np.testing.assert_array_equal(outputs, expected_outputs)
+    np.testing.assert_array_equal(losses, expected_losses)
+
+    outputs, losses = Trainer(trainer_args(batch_size=batch_size)).elementwise_test(model, data, half=True)
+    assert outputs.dtype == losses.dtype == np.float16
+    np.testing.assert_allclose(outputs, expected_outputs, rtol=1e-3, atol=1e-3)
+    np.testing.assert_allclose(losses, expected_losses, rtol=1e-3, atol=1e-3)
+
+    # without a criterion, the outputs only
+    outputs = elementwise_outputs(model, batch_loader(data, batch_size), len(data), 'cpu')
+    np.testing.assert_array_equal(outputs, expected_outputs)
+
+
+@pytest.mark.parametrize('num_epoch, batch_size', [(1, 6), (2, 64)])
+def test_captured_outputs_are_in_sample_order(num_epoch, batch_size):
+    # with a frozen model (lr=0) the outputs captured in shuffled training
+    # order must equal the ones of a forward pass in sample order
+    args = trainer_args(lr_local=0., num_epoch=num_epoch, batch_size=batch_size, capture_outputs=True)
+    data = toy_data(4)['train']['data'][3]
+    trainer = Trainer(args)
+    trainer.set_model(toy_model())
+    trainer.train(data, shuffle_seed=5)
+    outputs, losses = trainer.captured_outputs()
+
+    expected_outputs, expected_losses = trainer.elementwise_test(toy_model(), data)
+    np.testing.assert_allclose(outputs, expected_outputs, rtol=1e-6, atol=1e-6)
+    np.testing.assert_allclose(losses, expected_losses, rtol=1e-6, atol=1e-6)
+
+
+def test_partial_epoch_captures_nothing():
+    args = trainer_args(batch_size=5, num_updates=2, capture_outputs=True)
+    trainer = Trainer(args)
+    trainer.set_model(toy_model())
+    trainer.train(toy_data(1)['train']['data'][0], shuffle_seed=5)
+    assert trainer.captured_outputs() is None
+    assert np.isnan(trainer.captured[1]).sum() == 20 - 10